@@ -0,0 +1,338 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = '''
+---
+module: bigip_broker
+short_description: "Manages a local broker of warm F5 BIG-IP iControl clients"
+description:
+    - "Starts, stops or checks a controller side process that keeps authenticated
+       bigsuds clients and their parsed WSDLs alive per (host, user) and serves
+       them over a Unix socket. bigip_gtm_facts_v2, bigip_gtm_pool,
+       bigip_gtm_wide_ip, bigip_gtm_virtual_server and bigip_virtual_server send
+       their iControl calls through it when their broker_socket is listening,
+       instead of building a new client on every task"
+version_added: "2.0"
+notes:
+    - "F5 developed module 'bigsuds' required (see http://devcentral.f5.com)"
+    - "Must be run as a local_action in your playbook"
+    - "The socket is only accessible to its owner, a cached client is only
+       handed to requests carrying the password it was built with"
+    - "The client side (BrokerApi and broker_api) is shared with the modules
+       through module_utils/bigip_common.py"
+
+requirements:
+    - bigsuds
+options:
+    state:
+        description:
+            - Broker state
+        required: false
+        default: started
+        choices: ['started', 'stopped', 'status']
+    socket:
+        description:
+            - Unix socket path the broker listens on
+        required: false
+        default: ~/.ansible/bigip_broker.sock
+    idle_timeout:
+        description:
+            - Seconds an unused client is kept, the broker exits once it has had
+              no clients and no connections for this long
+        required: false
+        default: 600
+    health_interval:
+        description:
+            - Seconds between health checks of idle clients, a client failing
+              System.SystemInfo.get_version is discarded
+        required: false
+        default: 60
+'''
+
+EXAMPLES = '''
+  - name: Start iControl client broker
+    local_action: bigip_broker state=started
+    run_once: true
+
+  - name: Disable pool, reusing the broker's client
+    local_action: >
+      bigip_gtm_pool
+      server=192.168.0.1
+      user=admin
+      password=mysecret
+      state=disabled
+      pool=my_pool
+'''
+
+try:
+    import bigsuds
+except ImportError:
+    bigsuds_found = False
+else:
+    bigsuds_found = True
+
+import hashlib
+import json
+import os
+import socket
+import SocketServer
+import threading
+import time
+
+
+class ClientCache(object):
+    '''Idle bigsuds clients per (host, user), checked out by one connection at a time'''
+    def __init__(self, idle_timeout, health_interval):
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def checkout(self, host, user, password):
+        digest = hashlib.sha256(password).hexdigest()
+        with self.lock:
+            entries = self.idle.get((host, user), [])
+            for entry in entries:
+                if entry['digest'] == digest:
+                    entries.remove(entry)
+                    return entry
+        api = bigsuds.BIGIP(hostname=host, username=user, password=password)
+        return {'api': api, 'digest': digest, 'checked': time.time(), 'used': time.time()}
+
+    def checkin(self, host, user, entry):
+        entry['used'] = time.time()
+        with self.lock:
+            self.idle.setdefault((host, user), []).append(entry)
+
+    def sweep(self):
+        # drop expired clients, health check the rest outside the lock
+        now = time.time()
+        to_check = []
+        with self.lock:
+            for key, entries in self.idle.items():
+                for entry in list(entries):
+                    if now - entry['used'] > self.idle_timeout:
+                        entries.remove(entry)
+                    elif now - entry['checked'] > self.health_interval:
+                        entries.remove(entry)
+                        to_check.append((key, entry))
+                if not entries:
+                    del self.idle[key]
+        for key, entry in to_check:
+            try:
+                entry['api'].System.SystemInfo.get_version()
+            except Exception:
+                continue
+            entry['checked'] = time.time()
+            with self.lock:
+                self.idle.setdefault(key, []).append(entry)
+
+    def empty(self):
+        with self.lock:
+            return not self.idle
+
+
+class BrokerHandler(SocketServer.StreamRequestHandler):
+    '''One newline delimited json request/response exchange per iControl call'''
+    def handle(self):
+        server = self.server
+        server.connection_opened()
+        checked_out = {}
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                command = request.get('command')
+                if command == 'ping':
+                    self.respond({'result': os.getpid()})
+                elif command == 'shutdown':
+                    self.respond({'result': os.getpid()})
+                    threading.Thread(target=server.shutdown).start()
+                    break
+                else:
+                    self.call(request, checked_out)
+        finally:
+            for (host, user), entry in checked_out.items():
+                server.clients.checkin(host, user, entry)
+            server.connection_closed()
+
+    def call(self, request, checked_out):
+        key = (request['host'], request['user'])
+        try:
+            entry = checked_out.get(key)
+            if entry is None:
+                entry = self.server.clients.checkout(request['host'], request['user'],
+                                                     request['password'])
+                checked_out[key] = entry
+            method = entry['api']
+            for name in request['method'].split('.'):
+                method = getattr(method, name)
+            result = method(*request.get('args', []), **request.get('kwargs', {}))
+        except bigsuds.OperationFailed, e:
+            self.respond({'error': str(e), 'type': 'OperationFailed'})
+        except Exception, e:
+            # transport or parse errors leave the client in an unknown state
+            checked_out.pop(key, None)
+            self.respond({'error': str(e), 'type': type(e).__name__})
+        else:
+            self.respond({'result': result})
+
+    def respond(self, response):
+        self.wfile.write(json.dumps(response) + '\n')
+        self.wfile.flush()
+
+
+class BrokerServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, idle_timeout, health_interval):
+        SocketServer.UnixStreamServer.__init__(self, path, BrokerHandler)
+        self.clients = ClientCache(idle_timeout, health_interval)
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.last_activity = time.time()
+
+    def connection_opened(self):
+        with self.lock:
+            self.connections += 1
+            self.last_activity = time.time()
+
+    def connection_closed(self):
+        with self.lock:
+            self.connections -= 1
+            self.last_activity = time.time()
+
+    def maintain(self):
+        while True:
+            time.sleep(min(self.health_interval, self.idle_timeout, 10))
+            self.clients.sweep()
+            with self.lock:
+                idle = self.connections == 0 and time.time() - self.last_activity > self.idle_timeout
+            if idle and self.clients.empty():
+                self.shutdown()
+                return
+
+
+def broker_request(path, request, timeout=5):
+    # None when nothing is listening on path
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request) + '\n')
+        return json.loads(sock.makefile('r').readline())
+    except (socket.error, ValueError):
+        return None
+    finally:
+        sock.close()
+
+def serve(path, idle_timeout, health_interval):
+    if os.path.exists(path):
+        os.remove(path)
+    os.umask(0o077)
+    server = BrokerServer(path, idle_timeout, health_interval)
+    maintainer = threading.Thread(target=server.maintain)
+    maintainer.daemon = True
+    maintainer.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+def start_broker(path, idle_timeout, health_interval):
+    # double fork so the broker outlives the module and is not a zombie of it
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    try:
+        serve(path, idle_timeout, health_interval)
+    finally:
+        os._exit(0)
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            state = dict(type='str', default='started', choices=['started', 'stopped', 'status']),
+            socket = dict(type='str', default='~/.ansible/bigip_broker.sock'),
+            idle_timeout = dict(type='int', default=600),
+            health_interval = dict(type='int', default=60)
+        ),
+        supports_check_mode=True
+    )
+
+    if not bigsuds_found:
+        module.fail_json(msg="the python bigsuds module is required")
+
+    state = module.params['state']
+    path = os.path.expanduser(module.params['socket'])
+    idle_timeout = module.params['idle_timeout']
+    health_interval = module.params['health_interval']
+
+    if idle_timeout < 1 or health_interval < 1:
+        module.fail_json(msg="idle_timeout and health_interval must be at least 1")
+
+    result = {'changed': False, 'socket': path}  # default
+
+    try:
+        running = broker_request(path, {'command': 'ping'})
+        if state == 'status':
+            result['running'] = running is not None
+            if running is not None:
+                result['pid'] = running['result']
+        elif state == 'started' and running is None:
+            if not module.check_mode:
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                start_broker(path, idle_timeout, health_interval)
+                deadline = time.time() + 10
+                while running is None and time.time() < deadline:
+                    time.sleep(0.1)
+                    running = broker_request(path, {'command': 'ping'})
+                if running is None:
+                    module.fail_json(msg="broker did not start listening on %s" % path)
+                result['pid'] = running['result']
+            result['changed'] = True
+        elif state == 'started':
+            result['pid'] = running['result']
+        elif state == 'stopped' and running is not None:
+            if not module.check_mode:
+                broker_request(path, {'command': 'shutdown'})
+            result['changed'] = True
+    except Exception, e:
+        module.fail_json(msg="received exception: %s" % e)
+
+    module.exit_json(**result)
+
+# import module snippets
+from ansible.module_utils.basic import *
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = '''
+---
+module: bigip_gtm_batch
+short_description: "Applies a batch of F5 BIG-IP GTM changes in one transaction"
+description:
+    - "Reads the current state of every object in the batch with one call per
+       object type, then applies only the differences inside a single iControl
+       transaction: one call per object type and one commit. Either every change
+       is applied or none is"
+version_added: "2.0"
+notes:
+    - "Requires BIG-IP software version >= 11.4"
+    - "F5 developed module 'bigsuds' required (see http://devcentral.f5.com)"
+    - "Best run as a local_action in your playbook"
+    - "Tested with manager and above account privilege level"
+    - "Transactions are bound to an iControl session, so bigip_broker clients are not used"
+
+requirements:
+    - bigsuds
+options:
+    server:
+        description:
+            - BIG-IP host
+        required: true
+    user:
+        description:
+            - BIG-IP username
+        required: true
+    password:
+        description:
+            - BIG-IP password
+        required: true
+    operations:
+        description:
+            - List of changes. Each is a dict with type (pool, wide_ip or
+              virtual_server) and name. pool and virtual_server take state
+              (enabled or disabled), pool also takes pool_type (one of a, aaaa,
+              cname, mx, naptr or srv, default a), virtual_server also takes
+              server, and wide_ip takes lb_method. Pool names without a
+              partition are prefixed with partition. An object listed more than
+              once is changed once, and the task fails if the repeats ask for
+              different values
+        required: true
+    partition:
+        description:
+            - Partition name for pools
+        required: false
+        default: Common
+    transaction_timeout:
+        description:
+            - Seconds the device keeps the transaction open before discarding it
+        required: false
+        default: 60
+    cache_dir:
+        description:
+            - bigip_gtm_facts_v2 cache directory, entries affected by a change are removed
+        required: false
+        default: ~/.ansible/bigip_gtm_facts
+'''
+
+EXAMPLES = '''
+  - name: Fail over a datacenter
+    local_action:
+      module: bigip_gtm_batch
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      operations:
+        - { type: pool, name: my_pool_mn, state: disabled }
+        - { type: pool, name: my_pool_va, state: enabled }
+        - { type: pool, name: my_pool_va, pool_type: aaaa, state: enabled }
+        - { type: virtual_server, name: my_vs, server: my_server_mn, state: disabled }
+        - { type: wide_ip, name: my.wide.ip, lb_method: global_availability }
+'''
+
+try:
+    import bigsuds
+except ImportError:
+    bigsuds_found = False
+else:
+    bigsuds_found = True
+
+from ansible.module_utils.bigip_common import POOL_TYPES, invalidate_fact_cache, query_type
+
+lb_method_choices = ['return_to_dns', 'null', 'round_robin',
+                     'ratio', 'topology', 'static_persist', 'global_availability',
+                     'vs_capacity', 'least_conn', 'lowest_rtt', 'lowest_hops',
+                     'packet_rate', 'cpu', 'hit_ratio', 'qos', 'bps',
+                     'drop_packet', 'explicit_ip', 'connection_rate', 'vs_score']
+
+
+def bigip_api(server, user, password):
+    api = bigsuds.BIGIP(hostname=server, username=user, password=password)
+    return api
+
+def parse_operations(operations, partition):
+    # split the batch into (identifier, desired value, name) lists per object type.
+    # An object is changed once per transaction, so repeats must agree and are dropped
+    batch = {'pool': [], 'wide_ip': [], 'virtual_server': []}
+    seen = {}
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError("operation must be a dict, got: %s" % operation)
+        op_type = operation.get('type')
+        name = operation.get('name')
+        if op_type not in batch or not name:
+            raise ValueError("operation needs a name and a type of pool, wide_ip or virtual_server: %s" % operation)
+        if op_type == 'wide_ip':
+            lb_method = operation.get('lb_method')
+            if lb_method not in lb_method_choices:
+                raise ValueError("lb_method must be one of: %s, got: %s" % (",".join(lb_method_choices), lb_method))
+            item = (name, lb_method, name)
+            key = name
+        else:
+            state = operation.get('state')
+            if state not in ['enabled', 'disabled']:
+                raise ValueError("state must be enabled or disabled, got: %s" % state)
+            if op_type == 'pool':
+                if partition not in name:
+                    name = "/%s/%s" % (partition, name)
+                # the raw GTM_QUERY_TYPE_* value is still taken as well
+                pool_type = (operation.get('pool_type') or 'a').lower().replace('gtm_query_type_', '')
+                if pool_type not in POOL_TYPES:
+                    raise ValueError("pool_type of pool %s must be one of %s, got: %s"
+                                     % (name, ", ".join(POOL_TYPES), pool_type))
+                pool_id = {'pool_name': name, 'pool_type': query_type(pool_type)}
+                item = (pool_id, state, name)
+                key = (name, pool_type)
+            else:
+                if not operation.get('server'):
+                    raise ValueError("virtual_server operation needs a server: %s" % operation)
+                virtual_server_id = {'name': name, 'server': operation['server']}
+                item = (virtual_server_id, state, "%s:%s" % (operation['server'], name))
+                key = (name, operation['server'])
+        if (op_type, key) in seen:
+            if seen[(op_type, key)] != item[1]:
+                raise ValueError("%s %s is given more than once with different values" % (op_type, item[2]))
+            continue
+        seen[(op_type, key)] = item[1]
+        batch[op_type].append(item)
+    return batch
+
+def get_states(api, batch):
+    # one read per object type, values normalised like the desired values
+    current = {}
+    if batch['pool']:
+        states = api.GlobalLB.PoolV2.get_enabled_state([i[0] for i in batch['pool']])
+        current['pool'] = [s.split('STATE_')[1].lower() for s in states]
+    if batch['virtual_server']:
+        states = api.GlobalLB.VirtualServerV2.get_enabled_state([i[0] for i in batch['virtual_server']])
+        current['virtual_server'] = [s.split('STATE_')[1].lower() for s in states]
+    if batch['wide_ip']:
+        methods = api.GlobalLB.WideIP.get_lb_method([i[0] for i in batch['wide_ip']])
+        current['wide_ip'] = [m.strip().replace('LB_METHOD_', '').lower() for m in methods]
+    return current
+
+def apply_changes(api, changes, transaction_timeout):
+    api = api.with_session_id()
+    api.System.Session.set_transaction_timeout(transaction_timeout)
+    api.System.Session.start_transaction()
+    try:
+        if changes['pool']:
+            api.GlobalLB.PoolV2.set_enabled_state(
+                [c[0] for c in changes['pool']],
+                ["STATE_%s" % c[1].upper() for c in changes['pool']])
+        if changes['virtual_server']:
+            api.GlobalLB.VirtualServerV2.set_enabled_state(
+                [c[0] for c in changes['virtual_server']],
+                ["STATE_%s" % c[1].upper() for c in changes['virtual_server']])
+        if changes['wide_ip']:
+            api.GlobalLB.WideIP.set_lb_method(
+                [c[0] for c in changes['wide_ip']],
+                ["LB_METHOD_%s" % c[1].upper() for c in changes['wide_ip']])
+        api.System.Session.submit_transaction()
+    except Exception:
+        try:
+            api.System.Session.rollback_transaction()
+        except Exception:
+            pass
+        raise
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            server = dict(type='str', required=True),
+            user = dict(type='str', required=True),
+            password = dict(type='str', required=True, no_log=True),
+            operations = dict(type='list', required=True),
+            partition = dict(type='str', default='Common'),
+            transaction_timeout = dict(type='int', default=60),
+            cache_dir = dict(type='str', default='~/.ansible/bigip_gtm_facts')
+        ),
+        supports_check_mode=True
+    )
+
+    if not bigsuds_found:
+        module.fail_json(msg="the python bigsuds module is required")
+
+    server = module.params['server']
+    user = module.params['user']
+    password = module.params['password']
+    partition = module.params['partition']
+    transaction_timeout = module.params['transaction_timeout']
+
+    try:
+        batch = parse_operations(module.params['operations'], partition)
+    except ValueError, e:
+        module.fail_json(msg=str(e))
+
+    result = {'changed': False, 'changes': {}}  # default
+
+    try:
+        api = bigip_api(server, user, password)
+        current = get_states(api, batch)
+
+        changes = {'pool': [], 'wide_ip': [], 'virtual_server': []}
+        for op_type, items in batch.items():
+            for (identifier, desired, name), before in zip(items, current.get(op_type, [])):
+                if desired != before:
+                    changes[op_type].append((identifier, desired))
+                    result['changes'].setdefault(op_type, []).append(
+                        {'name': name, 'before': before, 'after': desired})
+
+        if result['changes']:
+            if not module.check_mode:
+                apply_changes(api, changes, transaction_timeout)
+            result['changed'] = True
+    except Exception, e:
+        module.fail_json(msg="received exception: %s" % e)
+
+    if result['changed'] and not module.check_mode:
+        categories = [c for c in ['pool', 'wide_ip', 'virtual_server'] if c in result['changes']]
+        if 'virtual_server' in categories and 'pool' not in categories:
+            categories.append('pool')
+        invalidate_fact_cache(module.params['cache_dir'], server, categories)
+
+    module.exit_json(**result)
+
+# import module snippets
+from ansible.module_utils.basic import *
+
+if __name__ == '__main__':
+    main()
@@ -31,6 +31,7 @@ notes:
     - "F5 developed module 'bigsuds' required (see http://devcentral.f5.com)"
     - "Best run as a local_action in your playbook"
     - "Tested with manager and above account privilege level"
+    - "Each field is fetched once per category, the number of iControl calls made is returned as api_calls"
 
 requirements:
     - bigsuds
@@ -69,6 +70,110 @@ options:
         required: false
         default: None
         aliases: []
+    filters:
+        description:
+            - List of filters, each a dict with pattern, match (exact, prefix,
+              contains, glob or regex, default exact), key (pool_name, server or
+              name, default every key of the category) and category. An object is
+              kept when it matches any filter that applies to its category, and
+              only kept objects are passed to the field calls
+        required: false
+        default: []
+        aliases: []
+    concurrency:
+        description:
+            - Number of worker threads, each with its own iControl client, used to
+              collect the included categories and their fields in parallel.
+              1 collects everything sequentially on a single client
+        required: false
+        default: 1
+        aliases: []
+    cache_dir:
+        description:
+            - Controller side directory holding cached facts. bigip_gtm_pool,
+              bigip_gtm_wide_ip and bigip_gtm_virtual_server remove the entries
+              they affect from the same directory when they make a change
+        required: false
+        default: ~/.ansible/bigip_gtm_facts
+        aliases: []
+    cache_ttl:
+        description:
+            - Seconds a cached category stays valid. 0 disables the cache
+        required: false
+        default: 0
+        aliases: []
+    cache_max_size:
+        description:
+            - Maximum size in bytes of cache_dir, oldest entries are evicted first
+        required: false
+        default: 52428800
+        aliases: []
+    cache_invalidate:
+        description:
+            - Drop every cached entry for this server before collecting
+        required: false
+        default: false
+        aliases: []
+    mode:
+        description:
+            - full returns every collected object as ansible_facts. delta compares
+              against the snapshot saved in cache_dir by the previous delta run and
+              returns, per category, the objects whose object_status, enabled_state,
+              member or lb_method changed plus the added and removed names.
+              statistics polls pool and virtual_server statistics with one call
+              per category per poll and returns per second rates of every counter
+              as InfluxDB line protocol in lines, or appends them to dest
+        required: false
+        default: full
+        choices: ['full', 'delta', 'statistics']
+        aliases: []
+    samples:
+        description:
+            - mode=statistics only. Number of statistics polls, rates are reported
+              for every poll after the first
+        required: false
+        default: 2
+        aliases: []
+    interval:
+        description:
+            - mode=statistics only. Seconds between the start of consecutive polls
+        required: false
+        default: 5
+        aliases: []
+    dest:
+        description:
+            - Write the output to this file instead of returning it. With
+              mode=full the file is replaced by JSON Lines, one object per line,
+              {"category", "id", "facts"}, written as its chunk arrives; the
+              module returns the path and the object count per category and the
+              cache is bypassed. With mode=statistics the line protocol lines are
+              appended to the file and lines_written is returned. Not supported
+              with mode=delta
+        required: false
+        default: None
+        aliases: []
+    chunk_size:
+        description:
+            - Maximum number of identifiers sent in one iControl request. Larger
+              lists are split into chunks that are reassembled in order, with
+              one chunk per worker in flight. 0 sends the whole list at once
+        required: false
+        default: 0
+        aliases: []
+    retries:
+        description:
+            - Times a request that failed on the transport is retried. Only the
+              failing chunk is retried
+        required: false
+        default: 2
+        aliases: []
+    broker_socket:
+        description:
+            - Unix socket of a bigip_broker process. When it is listening the
+              module reuses the broker's warm client instead of building its own
+        required: false
+        default: ~/.ansible/bigip_broker.sock
+        aliases: []
 '''
 
 EXAMPLES = '''
@@ -80,6 +185,68 @@ EXAMPLES = '''
       password=mysecret
       include=pool
       fact_filter=my_pool
+
+  - name: Get pool, virtual server and wide ip facts in parallel
+    local_action: >
+      bigip_gtm_facts_v2
+      server=192.168.0.1
+      user=admin
+      password=mysecret
+      include=pool,virtual_server,wide_ip
+      concurrency=4
+
+  - name: Get pool facts, reusing results collected in the last 30 seconds
+    local_action: >
+      bigip_gtm_facts_v2
+      server=192.168.0.1
+      user=admin
+      password=mysecret
+      include=pool
+      fact_filter=my_pool
+      cache_ttl=30
+
+  - name: Get pools and wide ips that changed since the last run
+    local_action: >
+      bigip_gtm_facts_v2
+      server=192.168.0.1
+      user=admin
+      password=mysecret
+      include=pool,wide_ip
+      mode=delta
+    register: gtm_delta
+
+  - name: Get facts for the pools of both datacenters
+    local_action:
+      module: bigip_gtm_facts_v2
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      include: pool
+      filters:
+        - { pattern: /Common/my_pool_mn, key: pool_name }
+        - { pattern: "/Common/my_pool_v*", match: glob, key: pool_name }
+
+  - name: Dump every virtual server to a file
+    local_action: >
+      bigip_gtm_facts_v2
+      server=192.168.0.1
+      user=admin
+      password=mysecret
+      include=virtual_server
+      chunk_size=500
+      dest=/tmp/gtm_virtual_servers.jsonl
+
+  - name: Sample pool and virtual server rates for telegraf
+    local_action: >
+      bigip_gtm_facts_v2
+      server=192.168.0.1
+      user=admin
+      password=mysecret
+      include=pool,virtual_server
+      mode=statistics
+      samples=13
+      interval=5
+      dest=/var/spool/telegraf/gtm_statistics.influx
 '''
 
 try:
@@ -89,152 +256,753 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import array
+import copy
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import Queue
 import re
+import tempfile
+import threading
+import time
+
+from ansible.module_utils.bigip_common import BrokerApi, broker_api
 
 
 class F5(object):
-    def __init__(self, host, user, password, session=False):
-        self.api = bigsuds.BIGIP(hostname=host, username=user,
-                                 password=password)
+    def __init__(self, host, user, password, session=False, broker_socket=None):
+        if session and broker_socket:
+            # a session id is bound to one client, the broker cannot hand it back
+            raise ValueError("session cannot be combined with broker_socket, "
+                             "iControl sessions need a client of their own")
+        self.api = None
+        if broker_socket:
+            self.api = broker_api(broker_socket, host, user, password)
+        if self.api is None:
+            self.api = bigsuds.BIGIP(hostname=host, username=user,
+                                     password=password)
+        self.api_calls = 0
         if session:
             self.start_session()
+    def start_session(self):
+        # bind the client to an iControl session so transactions can be used
+        if isinstance(self.api, BrokerApi):
+            raise ValueError("cannot start an iControl session on a bigip_broker client")
+        self.api = self.api.with_session_id()
     def get_api(self):
         return self.api
+    def close(self):
+        if isinstance(self.api, BrokerApi):
+            self.api._close()
+
+
+# keys each category can be filtered on
+OBJECT_KEYS = {
+    'pool': ['pool_name'],
+    'virtual_server': ['server', 'name'],
+    'wide_ip': ['name'],
+}
+
+
+class FactFilter(object):
+    '''Precompiled match of one pattern against object keys'''
+    matches_supported = ['exact', 'prefix', 'contains', 'glob', 'regex']
+
+    def __init__(self, pattern, match='exact', key=None, category=None):
+        if match not in self.matches_supported:
+            raise ValueError("match must be one of: %s, got: %s" % (",".join(self.matches_supported), match))
+        if category is not None and category not in OBJECT_KEYS:
+            raise ValueError("category must be one of: %s, got: %s" % (",".join(OBJECT_KEYS), category))
+        if key is not None and not [c for c in OBJECT_KEYS if key in OBJECT_KEYS[c] and category in (None, c)]:
+            raise ValueError("key %s is not valid for category %s" % (key, category))
+        self.pattern = pattern
+        self.match = match
+        self.key = key
+        self.category = category
+        if match == 'exact':
+            self.test = lambda value: value == pattern
+        elif match == 'prefix':
+            self.test = lambda value: value.startswith(pattern)
+        elif match == 'contains':
+            self.test = lambda value: pattern in value
+        elif match == 'glob':
+            self.test = re.compile(fnmatch.translate(pattern)).match
+        else:
+            self.test = re.compile(pattern).search
+
+    def applies(self, category):
+        if self.category is not None:
+            return self.category == category
+        return self.key is None or self.key in OBJECT_KEYS[category]
+
+    def matches(self, category, item):
+        if category == 'wide_ip':
+            item = {'name': item}
+        keys = [self.key] if self.key else OBJECT_KEYS[category]
+        return any(self.test(item[key]) for key in keys)
+
+    def spec(self):
+        return [self.pattern, self.match, self.key, self.category]
+
+
+def select(category, items, filters):
+    # keep items matching any filter that applies to the category
+    active = [f for f in filters or [] if f.applies(category)]
+    if not active:
+        return items
+    return [item for item in items if any(f.matches(category, item) for f in active)]
 
+def filter_spec(category, filters):
+    return [f.spec() for f in filters or [] if f.applies(category)]
 
-class Pools(object):
-    def __init__(self, api, regex=None):
+
+class GtmObjects(object):
+    # identifiers sent per iControl request (0 sends the whole list) and
+    # retries of a failed request before giving up on the field
+    chunk_size = 0
+    retries = 0
+    chunk = None
+
+    def bind(self, api, chunk=None):
+        # copy of the filtered collection issuing its calls through another
+        # client, optionally restricted to one (start, stop) chunk
+        clone = copy.copy(self)
+        clone.api = api
+        clone.chunk = chunk
+        return clone
+
+    def items(self):
+        if self.chunk:
+            return self.get_list()[self.chunk[0]:self.chunk[1]]
+        return self.get_list()
+
+    def chunks(self):
+        size = len(self.get_list())
+        if not self.chunk_size or size <= self.chunk_size:
+            return [(0, size)]
+        return [(start, min(start + self.chunk_size, size)) for start in range(0, size, self.chunk_size)]
+
+    def call(self, method):
+        if self.chunk:
+            return self.call_chunk(method, self.items())
+        result = None
+        for start, stop in self.chunks():
+            response = self.call_chunk(method, self.get_list()[start:stop])
+            if result is None:
+                result = response
+            elif isinstance(result, dict):
+                # statistics responses wrap the per object list with a time stamp
+                result['statistics'].extend(response['statistics'])
+            else:
+                result.extend(response)
+        return result
+
+    def call_chunk(self, method, items):
+        # retry transport errors on this chunk only, iControl faults are final
+        attempt = 0
+        while True:
+            self.api_calls += 1
+            try:
+                return method(items)
+            except bigsuds.OperationFailed:
+                raise
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                time.sleep(attempt)
+
+
+class Pools(GtmObjects):
+    def __init__(self, api, filters=None):
         self.api = api
-        self.pool_names = api.GlobalLB.PoolV2.get_list()
-        if regex:
-            self.pool_names = [d for d in self.pool_names if regex in d['pool_name']]
+        self.pool_names = select('pool', api.GlobalLB.PoolV2.get_list(), filters)
+        self.api_calls = 1
 
     def get_list(self):
         return self.pool_names
 
     def get_object_status(self):
-        return self.api.GlobalLB.PoolV2.get_object_status(self.pool_names)
+        return self.call(self.api.GlobalLB.PoolV2.get_object_status)
 
     def get_lb_method(self):
-        return self.api.GlobalLB.PoolV2.get_preferred_lb_method(self.pool_names)
+        return self.call(self.api.GlobalLB.PoolV2.get_preferred_lb_method)
 
     def get_member(self):
-        return self.api.GlobalLB.PoolV2.get_member(self.pool_names)
+        return self.call(self.api.GlobalLB.PoolV2.get_member)
+
+    def get_statistics(self):
+        return self.call(self.api.GlobalLB.PoolV2.get_statistics)
 
 
-class VirtualServers(object):
-    def __init__(self, api, regex=None):
+class VirtualServers(GtmObjects):
+    def __init__(self, api, filters=None):
         self.api = api
-        self.virtual_servers = api.GlobalLB.VirtualServerV2.get_list()
         #Look to support as many fields in dict as available not just name, server
-        if regex:
-            self.virtual_servers = [d for d in self.virtual_servers if regex in d['server'] or regex in d['name']]
+        self.virtual_servers = select('virtual_server', api.GlobalLB.VirtualServerV2.get_list(), filters)
+        self.api_calls = 1
     def get_list(self):
         return self.virtual_servers
     def get_enabled_state(self):
-        return self.api.GlobalLB.VirtualServerV2.get_enabled_state(self.virtual_servers)
+        return self.call(self.api.GlobalLB.VirtualServerV2.get_enabled_state)
     def get_object_status(self):
-        return self.api.GlobalLB.VirtualServerV2.get_object_status(self.virtual_servers)
+        return self.call(self.api.GlobalLB.VirtualServerV2.get_object_status)
     #def get_ltm_virtual_server(self):
-    #    return self.api.GlobalLB.VirtualServerV2.get_ltm_virtual_server(self.virtual_servers)
-    #def get_statistics(self):
-    #   return self.api.GlobalLB.VirtualServerV2.get_statistics(self.virtual_servers)
+    #    return self.call(self.api.GlobalLB.VirtualServerV2.get_ltm_virtual_server)
+    def get_statistics(self):
+        return self.call(self.api.GlobalLB.VirtualServerV2.get_statistics)
     def get_address(self):
-        return self.api.GlobalLB.VirtualServerV2.get_address(self.virtual_servers)
+        return self.call(self.api.GlobalLB.VirtualServerV2.get_address)
 
 
-class WideIps(object):
-    def __init__(self, api, regex=None):
+class WideIps(GtmObjects):
+    def __init__(self, api, filters=None):
         self.api = api
-        self.wide_ips = api.GlobalLB.WideIP.get_list()
-        if regex:
-            re_filter = re.compile(regex)
-            self.wide_ips = filter(re_filter.search, self.wide_ips)
+        self.wide_ips = select('wide_ip', api.GlobalLB.WideIP.get_list(), filters)
+        self.api_calls = 1
 
     def get_list(self):
         return self.wide_ips
 
     def get_lb_method(self):
-        return self.api.GlobalLB.WideIP.get_lb_method(self.wide_ips)
+        return self.call(self.api.GlobalLB.WideIP.get_lb_method)
 
     def get_pool(self):
-        return self.api.GlobalLB.WideIP.get_wideip_pool(self.wide_ips)
+        return self.call(self.api.GlobalLB.WideIP.get_wideip_pool)
 
-def generate_wide_ip_dict(f5, regex):
-    wide_ips = WideIps(f5.get_api(), regex)
-    fields = ['lb_method', 'pool']
-    return generate_dict(wide_ips, fields)
+    def get_object_status(self):
+        return self.call(self.api.GlobalLB.WideIP.get_object_status)
 
-def generate_pool_dict(f5, regex):
-    pools = Pools(f5.get_api(), regex)
-    fields = ['member', 'object_status']
-    result_dict = {}
-    lists = []
-    supported_fields = []
-    if pools.get_list():
-        for field in fields:
+    def get_enabled_state(self):
+        return self.call(self.api.GlobalLB.WideIP.get_enabled_state)
+
+
+class WorkerPool(object):
+    '''Bounded set of threads, each holding its own iControl client'''
+    def __init__(self, host, user, password, size, broker_socket=None):
+        self.size = size
+        self.tasks = Queue.Queue()
+        self.threads = []
+        for _ in range(size):
+            thread = threading.Thread(target=self._work, args=(host, user, password, broker_socket))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self, host, user, password, broker_socket):
+        f5 = None
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                if f5 is not None:
+                    f5.close()
+                return
+            index, fn, args, results = task
+            try:
+                # bigsuds clients are not thread safe, so each worker builds its own
+                if f5 is None:
+                    f5 = F5(host, user, password, broker_socket=broker_socket)
+                results.put((index, None, fn(f5.get_api(), *args)))
+            except Exception, e:
+                results.put((index, e, None))
+
+    def run(self, calls):
+        # run (fn, args) pairs as fn(api, *args), returning (error, value) in call order
+        results = Queue.Queue()
+        for index, (fn, args) in enumerate(calls):
+            self.tasks.put((index, fn, args, results))
+        ordered = [None] * len(calls)
+        for _ in calls:
+            index, error, value = results.get()
+            ordered[index] = (error, value)
+        return ordered
+
+    def close(self):
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def write_atomic(directory, path, write):
+    # write to a temp file and rename so readers never see a partial entry.
+    # Parallel runs share the directory, so errors are swallowed and reported
+    # as False instead of failing the caller
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        # another run may have created it in between
+        pass
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp_file:
+            write(tmp_file)
+        os.rename(tmp_path, path)
+    except (OSError, IOError):
+        if tmp_path is not None:
             try:
-                api_response = getattr(pools, "get_" + field)()
-            except Exception:  # Removed specific exceptions
+                os.remove(tmp_path)
+            except OSError:
                 pass
-            else:
-                lists.append(api_response)
-                supported_fields.append(field)
-        for i, j in enumerate(pools.get_list()):
-            key = j['pool_name']
-            temp = {}
-            temp.update([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
-            result_dict[key] = temp
-    return result_dict
+        return False
+    return True
+
+
+class FactCache(object):
+    '''Controller side cache of collected categories, one json file per
+    (server, category, fact_filter, fields) under cache_dir/<server>/'''
+    def __init__(self, cache_dir, server, ttl, max_size):
+        self.server_dir = os.path.join(os.path.expanduser(cache_dir),
+                                       re.sub(r'[^A-Za-z0-9_.-]', '_', server))
+        self.cache_dir = os.path.dirname(self.server_dir)
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def path(self, category, filters):
+        fields = CATEGORIES[category][1]
+        digest = hashlib.sha1(json.dumps([category, filter_spec(category, filters), fields])).hexdigest()
+        return os.path.join(self.server_dir, "%s-%s.json" % (category, digest))
+
+    def get(self, category, filters):
+        path = self.path(category, filters)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, category, filters, facts):
+        # a failed write only costs the next run its cache hit
+        if not write_atomic(self.server_dir, self.path(category, filters),
+                            lambda tmp_file: json.dump(facts, tmp_file)):
+            return
+        self.evict()
+
+    def snapshot_path(self, category, filters):
+        digest = hashlib.sha1(json.dumps([category, filter_spec(category, filters)])).hexdigest()
+        return os.path.join(self.server_dir, "%s-%s.snapshot" % (category, digest))
+
+    def invalidate(self, categories=None):
+        for category in categories or CATEGORIES.keys():
+            for path in glob.glob(os.path.join(self.server_dir, "%s-*.json" % category)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
 
-def generate_virtual_server_dict(f5, regex):
-    virtual_servers = VirtualServers(f5.get_api(), regex)
-    fields = ['enabled_state', 'object_status',
-              'ltm_virtual_server', 'statistics', 'address']
-    attributes = {}
+    def evict(self):
+        # drop the oldest entries across all servers until under max_size bytes
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*', '*.json')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def iter_objects(category, facts):
+    # yield (key, identifier, attributes) for every object of a category
+    if category == 'virtual_server':
+        for server, names in facts.iteritems():
+            for name, attributes in names.iteritems():
+                yield json.dumps([server, name]), {'server': server, 'name': name}, attributes
+    else:
+        for name, attributes in facts.iteritems():
+            yield json.dumps([name]), name, attributes
+
+def key_identifier(category, key):
+    key = json.loads(key)
+    if category == 'virtual_server':
+        return {'server': key[0], 'name': key[1]}
+    return key[0]
+
+def fingerprint(attributes):
+    tracked = dict((f, attributes[f]) for f in DELTA_FIELDS if f in attributes)
+    return hashlib.sha1(json.dumps(tracked, sort_keys=True)).hexdigest()
+
+def read_snapshot(path):
+    # snapshot lines are "<fingerprint> <key>" sorted by key
+    try:
+        snapshot = open(path)
+    except IOError:
+        return
+    with snapshot:
+        for line in snapshot:
+            digest, key = line.rstrip('\n').split(' ', 1)
+            yield key, digest
+
+def compute_delta(category, facts, snapshot_path):
+    '''Merge the current objects against the previous snapshot, streaming
+    the old snapshot from disk, then save the new one in its place'''
+    delta = {'changed': {}, 'added': [], 'removed': []}
+    previous = read_snapshot(snapshot_path)
+    old = next(previous, None)
+    lines = []
+    for key, identifier, attributes in sorted(iter_objects(category, facts), key=lambda o: o[0]):
+        digest = fingerprint(attributes)
+        lines.append("%s %s\n" % (digest, key))
+        while old is not None and old[0] < key:
+            delta['removed'].append(key_identifier(category, old[0]))
+            old = next(previous, None)
+        if old is not None and old[0] == key:
+            if old[1] != digest:
+                if category == 'virtual_server':
+                    delta['changed'].setdefault(identifier['server'], {})[identifier['name']] = attributes
+                else:
+                    delta['changed'][identifier] = attributes
+            old = next(previous, None)
+        else:
+            delta['added'].append(identifier)
+    while old is not None:
+        delta['removed'].append(key_identifier(category, old[0]))
+        old = next(previous, None)
+    # the delta stands even if the snapshot cannot be saved, the next run
+    # then compares against the older one
+    previous.close()
+    write_atomic(os.path.dirname(snapshot_path), snapshot_path,
+                 lambda new_snapshot: new_snapshot.writelines(lines))
+    return delta
+
+
+def collect_fields(api_obj, fields):
+    # fetch each field once for the whole object list, skipping unsupported ones
     lists = []
     supported_fields = []
+    for field in fields:
+        getter = getattr(api_obj, "get_" + field, None)
+        if getter is None:
+            continue
+        try:
+            api_response = getter()
+        except Exception:  # Removed specific exceptions
+            pass
+        else:
+            lists.append(api_response)
+            supported_fields.append(field)
+    return supported_fields, lists
+
+def fetch_field(api, api_obj, field, chunk):
+    # returns (api calls made, response) for one chunk of one field
+    bound = api_obj.bind(api, chunk)
+    bound.api_calls = 0
+    response = getattr(bound, "get_" + field)()
+    return bound.api_calls, response
+
+def build_pool_dict(pools, supported_fields, lists):
+    result_dict = {}
+    for i, j in enumerate(pools.get_list()):
+        result_dict[j['pool_name']] = dict([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
+    return result_dict
+
+def build_virtual_server_dict(virtual_servers, supported_fields, lists):
     servers = {}
     for i, j in enumerate(virtual_servers.get_list()):
-        for field in fields:
-            try:
-                api_response = getattr(virtual_servers, "get_" + field)()
-            except Exception:  # Removed specific exceptions
-                pass
-            else:
-                lists.append(api_response)
-                supported_fields.append(field)
-        temp = {}
-        temp.update([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
-        attributes = temp
-        if j['server'] not in servers:
-            names = { j['name'] : attributes }
-            servers.update({j['server']:names})
-        else:
-            names = servers[j['server']]
-            names.update({ j['name'] : attributes })
-            servers.update({j['server']:names})
+        attributes = dict([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
+        servers.setdefault(j['server'], {})[j['name']] = attributes
     return servers
 
-def generate_dict(api_obj, fields):
+def build_dict(api_obj, supported_fields, lists):
+    result_dict = {}
+    for i, j in enumerate(api_obj.get_list()):
+        result_dict[j] = dict([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
+    return result_dict
+
+# fields compared between snapshots in delta mode
+DELTA_FIELDS = ['object_status', 'enabled_state', 'member', 'lb_method']
+
+# include name -> (collection class, fields, dict builder)
+CATEGORIES = {
+    'pool': (Pools, ['member', 'object_status', 'lb_method'], build_pool_dict),
+    'virtual_server': (VirtualServers, ['enabled_state', 'object_status',
+                                        'ltm_virtual_server', 'address'],
+                       build_virtual_server_dict),
+    'wide_ip': (WideIps, ['lb_method', 'pool', 'object_status', 'enabled_state'], build_dict),
+}
+
+def generate_category_dict(f5, category, filters, chunk_size=0, retries=0):
+    cls, fields, builder = CATEGORIES[category]
+    api_obj = cls(f5.get_api(), filters)
+    api_obj.chunk_size = chunk_size
+    api_obj.retries = retries
     result_dict = {}
-    lists = []
-    supported_fields = []
     if api_obj.get_list():
-        for field in fields:
-            try:
-                api_response = getattr(api_obj, "get_" + field)()
-            except Exception:  # Removed specific exceptions
-                pass
-            else:
-                lists.append(api_response)
-                supported_fields.append(field)
-        for i, j in enumerate(api_obj.get_list()):
-            temp = {}
-            temp.update([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
-            result_dict[j] = temp
+        result_dict = builder(api_obj, *collect_fields(api_obj, fields))
+    f5.api_calls += api_obj.api_calls
     return result_dict
 
+def generate_wide_ip_dict(f5, filters):
+    return generate_category_dict(f5, 'wide_ip', filters)
+
+def generate_pool_dict(f5, filters):
+    return generate_category_dict(f5, 'pool', filters)
+
+def generate_virtual_server_dict(f5, filters):
+    return generate_category_dict(f5, 'virtual_server', filters)
+
+def list_categories(workers, include, filters, chunk_size=0, retries=0):
+    # list and filter every category in parallel
+    api_calls = 0
+    api_objs = []
+    for error, api_obj in workers.run([(CATEGORIES[c][0], (filters,)) for c in include]):
+        if error is not None:
+            raise error
+        api_obj.chunk_size = chunk_size
+        api_obj.retries = retries
+        api_objs.append(api_obj)
+        api_calls += api_obj.api_calls
+    return api_objs, api_calls
+
+def generate_facts_concurrent(workers, include, filters, chunk_size=0, retries=0):
+    # first sweep lists every category, second sweep fetches every
+    # (category, field, chunk) so at most one chunk per worker is in flight
+    facts = {}
+    api_objs, api_calls = list_categories(workers, include, filters, chunk_size, retries)
+
+    calls = []
+    owners = []
+    for category, api_obj in zip(include, api_objs):
+        if not api_obj.get_list():
+            continue
+        for field in CATEGORIES[category][1]:
+            if hasattr(api_obj, "get_" + field):
+                for chunk in api_obj.chunks():
+                    calls.append((fetch_field, (api_obj, field, chunk)))
+                    owners.append((category, field))
+    responses = workers.run(calls)
+
+    # reassemble chunks in order, a field with any failed chunk is dropped
+    assembled = {}
+    for owner, (error, value) in zip(owners, responses):
+        if error is not None:
+            api_calls += retries + 1
+            assembled[owner] = None
+            continue
+        api_calls += value[0]
+        if owner not in assembled:
+            assembled[owner] = value[1]
+        elif assembled[owner] is not None:
+            assembled[owner].extend(value[1])
+
+    for category, api_obj in zip(include, api_objs):
+        supported_fields = []
+        lists = []
+        for field in CATEGORIES[category][1]:
+            if assembled.get((category, field)) is not None:
+                supported_fields.append(field)
+                lists.append(assembled[(category, field)])
+        facts[category] = CATEGORIES[category][2](api_obj, supported_fields, lists)
+    return facts, api_calls
+
+# category -> (measurement, key of the object in a statistics entry)
+STATISTICS_MEASUREMENTS = {
+    'pool': ('bigip_gtm_pool', 'pool'),
+    'virtual_server': ('bigip_gtm_virtual_server', 'virtual_server'),
+}
+
+def escape_tag(value):
+    return re.sub(r'([,= ])', r'\\\1', str(value))
+
+class StatisticsSampler(object):
+    '''Counters of one category held in flat arrays, one row of stat types
+    per object, reused across polls'''
+    def __init__(self, category, api_obj, host):
+        self.category = category
+        self.api_obj = api_obj
+        self.measurement, self.entry_key = STATISTICS_MEASUREMENTS[category]
+        self.host = escape_tag(host)
+        self.tags = None
+        self.stat_types = None
+        self.previous = None
+        self.current = None
+        self.sampled_at = None
+
+    def poll(self):
+        response = self.api_obj.get_statistics()
+        now = time.time()
+        entries = response['statistics']
+        if self.stat_types is None:
+            self.setup(entries)
+        else:
+            self.previous, self.current = self.current, self.previous
+        width = len(self.stat_types)
+        column = self.column
+        current = self.current
+        for row, entry in enumerate(entries):
+            base = row * width
+            for statistic in entry['statistics']:
+                index = column.get(statistic['type'])
+                if index is not None:
+                    value = statistic['value']
+                    current[base + index] = (value['high'] << 32) | value['low']
+        elapsed = None
+        if self.sampled_at is not None:
+            elapsed = now - self.sampled_at
+        self.sampled_at = now
+        return elapsed
+
+    def setup(self, entries):
+        self.stat_types = [s['type'] for s in entries[0]['statistics']] if entries else []
+        self.column = dict((t, i) for i, t in enumerate(self.stat_types))
+        self.fields = [t.replace('STATISTIC_', '', 1).lower() + '_rate' for t in self.stat_types]
+        size = len(entries) * len(self.stat_types)
+        self.previous = array.array('d', [0.0]) * size
+        self.current = array.array('d', [0.0]) * size
+        self.tags = []
+        for entry in entries:
+            identifier = entry[self.entry_key]
+            if self.category == 'pool':
+                tags = "pool=%s" % escape_tag(identifier['pool_name'])
+            else:
+                tags = "virtual_server=%s,vs_server=%s" % (escape_tag(identifier['name']),
+                                                          escape_tag(identifier['server']))
+            self.tags.append("%s,host=%s,%s" % (self.measurement, self.host, tags))
+
+    def lines(self, elapsed):
+        # per second rate of every counter, a counter that went backwards was reset
+        timestamp = int(self.sampled_at * 1e9)
+        width = len(self.stat_types)
+        previous = self.previous
+        current = self.current
+        for row, tags in enumerate(self.tags):
+            base = row * width
+            fields = []
+            for index, field in enumerate(self.fields):
+                delta = current[base + index] - previous[base + index]
+                if delta >= 0:
+                    fields.append("%s=%.3f" % (field, delta / elapsed))
+            if fields:
+                yield "%s %s %d" % (tags, ",".join(fields), timestamp)
+
+def sample_statistics(f5, host, categories, filters, samples, interval, chunk_size=0, retries=0):
+    samplers = []
+    for category in categories:
+        api_obj = CATEGORIES[category][0](f5.get_api(), filters)
+        api_obj.chunk_size = chunk_size
+        api_obj.retries = retries
+        if api_obj.get_list():
+            samplers.append(StatisticsSampler(category, api_obj, host))
+    lines = []
+    for sample in range(samples):
+        started = time.time()
+        for sampler in samplers:
+            elapsed = sampler.poll()
+            if elapsed:
+                lines.extend(sampler.lines(elapsed))
+        if sample < samples - 1:
+            time.sleep(max(0, interval - (time.time() - started)))
+    for sampler in samplers:
+        f5.api_calls += sampler.api_obj.api_calls
+    return lines
+
+def iter_rows(category, api_obj, supported_fields, lists):
+    # yield (identifier, attributes) for the objects of a collection or chunk
+    for i, j in enumerate(api_obj.items()):
+        attributes = dict([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
+        if category == 'virtual_server':
+            yield {'server': j['server'], 'name': j['name']}, attributes
+        elif category == 'pool':
+            yield j['pool_name'], attributes
+        else:
+            yield j, attributes
+
+def write_rows(out, category, api_obj, supported_fields, lists):
+    count = 0
+    for identifier, attributes in iter_rows(category, api_obj, supported_fields, lists):
+        out.write(json.dumps({'category': category, 'id': identifier, 'facts': attributes}) + '\n')
+        count += 1
+    return count
+
+def stream_category(f5, category, filters, out, chunk_size=0, retries=0):
+    # collect and write one chunk at a time so only a chunk is held in memory
+    cls, fields, _ = CATEGORIES[category]
+    api_obj = cls(f5.get_api(), filters)
+    api_obj.chunk_size = chunk_size
+    api_obj.retries = retries
+    count = 0
+    if api_obj.get_list():
+        for chunk in api_obj.chunks():
+            part = api_obj.bind(api_obj.api, chunk)
+            part.api_calls = 0
+            count += write_rows(out, category, part, *collect_fields(part, fields))
+            api_obj.api_calls += part.api_calls
+    f5.api_calls += api_obj.api_calls
+    return count
+
+def stream_facts_concurrent(workers, include, filters, out, chunk_size=0, retries=0):
+    # fetch the fields of as many chunks as there are workers, write them, move on
+    counts = {}
+    api_objs, api_calls = list_categories(workers, include, filters, chunk_size, retries)
+    for category, api_obj in zip(include, api_objs):
+        counts[category] = 0
+        if not api_obj.get_list():
+            continue
+        fields = [f for f in CATEGORIES[category][1] if hasattr(api_obj, "get_" + f)]
+        chunks = api_obj.chunks()
+        window = max(1, workers.size // max(1, len(fields)))
+        for start in range(0, len(chunks), window):
+            group = chunks[start:start + window]
+            responses = workers.run([(fetch_field, (api_obj, field, chunk))
+                                     for chunk in group for field in fields])
+            for index, chunk in enumerate(group):
+                supported_fields = []
+                lists = []
+                for offset, field in enumerate(fields):
+                    error, value = responses[index * len(fields) + offset]
+                    if error is not None:
+                        api_calls += retries + 1
+                        continue
+                    api_calls += value[0]
+                    supported_fields.append(field)
+                    lists.append(value[1])
+                counts[category] += write_rows(out, category, api_obj.bind(None, chunk),
+                                               supported_fields, lists)
+    return counts, api_calls
+
+def stream_facts_file(dest, server, user, password, categories, filters,
+                      concurrency=1, chunk_size=0, retries=0, broker_socket=None):
+    # written to a temp file and renamed so readers never see a partial dump
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as out:
+            if concurrency > 1:
+                workers = WorkerPool(server, user, password, concurrency, broker_socket)
+                try:
+                    counts, api_calls = stream_facts_concurrent(workers, categories, filters, out,
+                                                                chunk_size, retries)
+                finally:
+                    workers.close()
+            else:
+                f5 = F5(server, user, password, broker_socket=broker_socket)
+                try:
+                    counts = {}
+                    for category in categories:
+                        counts[category] = stream_category(f5, category, filters, out, chunk_size, retries)
+                    api_calls = f5.api_calls
+                finally:
+                    f5.close()
+        os.rename(tmp_path, dest)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return counts, api_calls
+
 def main():
     valid_includes = ['pool', 'wide_ip', 'virtual_server']
 
@@ -244,7 +1012,20 @@ def main():
             user = dict(type='str', required=True),
             password = dict(type='str', required=True, no_log=True),
             include = dict(type='list', required=True),
-            fact_filter = dict(type='str', required=False)
+            fact_filter = dict(type='str', required=False),
+            filters = dict(type='list', default=[]),
+            concurrency = dict(type='int', default=1),
+            cache_dir = dict(type='str', default='~/.ansible/bigip_gtm_facts'),
+            cache_ttl = dict(type='int', default=0),
+            cache_max_size = dict(type='int', default=52428800),
+            cache_invalidate = dict(type='bool', default=False),
+            mode = dict(type='str', default='full', choices=['full', 'delta', 'statistics']),
+            samples = dict(type='int', default=2),
+            interval = dict(type='int', default=5),
+            dest = dict(type='str', required=False),
+            chunk_size = dict(type='int', default=0),
+            retries = dict(type='int', default=2),
+            broker_socket = dict(type='str', default='~/.ansible/bigip_broker.sock')
         ),
         supports_check_mode=False
     )
@@ -256,28 +1037,113 @@ def main():
     user = module.params['user']
     password = module.params['password']
     fact_filter = module.params['fact_filter']
+    filter_specs = module.params['filters']
+    concurrency = module.params['concurrency']
+    cache_dir = module.params['cache_dir']
+    cache_ttl = module.params['cache_ttl']
+    cache_max_size = module.params['cache_max_size']
+    cache_invalidate = module.params['cache_invalidate']
+    mode = module.params['mode']
+    samples = module.params['samples']
+    interval = module.params['interval']
+    dest = module.params['dest']
+    chunk_size = module.params['chunk_size']
+    retries = module.params['retries']
+    broker_socket = module.params['broker_socket']
     include = [x.lower() for x in module.params['include']]
     include_test = map(lambda x: x in valid_includes, include)
     if not all(include_test):
         module.fail_json(msg="value of include must be one or more of: %s, got: %s" % (",".join(valid_includes), ",".join(include)))
+    if concurrency < 1:
+        module.fail_json(msg="concurrency must be at least 1, got: %s" % concurrency)
+    if chunk_size < 0 or retries < 0:
+        module.fail_json(msg="chunk_size and retries must not be negative")
+    if dest and mode == 'delta':
+        module.fail_json(msg="dest cannot be combined with mode=delta")
+    if mode == 'statistics':
+        if [c for c in include if c not in STATISTICS_MEASUREMENTS]:
+            module.fail_json(msg="mode=statistics supports include of: %s" % ",".join(STATISTICS_MEASUREMENTS))
+        if samples < 2 or interval < 1:
+            module.fail_json(msg="mode=statistics needs samples of at least 2 and interval of at least 1")
+    if dest:
+        dest = os.path.abspath(os.path.expanduser(dest))
 
     facts = {}
 
-    if fact_filter:
-        regex = fact_filter
-    else:
-        regex = None
+    try:
+        filters = [FactFilter(**spec) for spec in filter_specs]
+        if fact_filter:
+            # legacy fact_filter: substring for pools and virtual servers, regex for wide ips
+            filters.extend([FactFilter(fact_filter, 'contains', category='pool'),
+                            FactFilter(fact_filter, 'contains', category='virtual_server'),
+                            FactFilter(fact_filter, 'regex', category='wide_ip')])
+    except (TypeError, ValueError, re.error), e:
+        module.fail_json(msg="invalid filter: %s" % e)
 
     try:
-        if len(include) > 0:
-            f5 = F5(server, user, password)
-            if 'pool' in include:
-                facts['pool'] = generate_pool_dict(f5, regex)
-            if 'virtual_server' in include:
-                facts['virtual_server'] = generate_virtual_server_dict(f5, regex)
-            if 'wide_ip' in include:
-                facts['wide_ip'] = generate_wide_ip_dict(f5, regex)
-            result = {'ansible_facts': facts}
+        categories = [c for c in valid_includes if c in include]
+        if mode == 'statistics':
+            f5 = F5(server, user, password, broker_socket=broker_socket)
+            try:
+                lines = sample_statistics(f5, server, categories, filters, samples, interval,
+                                          chunk_size, retries)
+            finally:
+                f5.close()
+            result = {'api_calls': f5.api_calls, 'samples': samples}
+            if dest:
+                with open(dest, 'a') as out:
+                    out.write(''.join(line + '\n' for line in lines))
+                result.update(dest=dest, lines_written=len(lines))
+            else:
+                result['lines'] = lines
+        elif dest:
+            counts, api_calls = stream_facts_file(dest, server, user, password, categories, filters,
+                                                  concurrency, chunk_size, retries, broker_socket)
+            result = {'dest': dest, 'objects': counts, 'api_calls': api_calls}
+        else:
+            cache = None
+            if cache_ttl > 0 or cache_invalidate:
+                cache = FactCache(cache_dir, server, cache_ttl, cache_max_size)
+                if cache_invalidate:
+                    cache.invalidate()
+            cache_hits = []
+            if cache is not None and cache_ttl > 0:
+                for category in categories:
+                    cached = cache.get(category, filters)
+                    if cached is not None:
+                        facts[category] = cached
+                        cache_hits.append(category)
+            missing = [c for c in categories if c not in cache_hits]
+
+            api_calls = 0
+            if missing and concurrency > 1:
+                workers = WorkerPool(server, user, password, concurrency, broker_socket)
+                try:
+                    collected, api_calls = generate_facts_concurrent(workers, missing, filters, chunk_size, retries)
+                finally:
+                    workers.close()
+                facts.update(collected)
+            elif missing:
+                f5 = F5(server, user, password, broker_socket=broker_socket)
+                try:
+                    for category in missing:
+                        facts[category] = generate_category_dict(f5, category, filters, chunk_size, retries)
+                finally:
+                    f5.close()
+                api_calls = f5.api_calls
+
+            if cache is not None and cache_ttl > 0:
+                for category in missing:
+                    cache.put(category, filters, facts[category])
+            result = {'api_calls': api_calls, 'cache_hits': cache_hits}
+            if mode == 'delta':
+                snapshots = FactCache(cache_dir, server, cache_ttl, cache_max_size)
+                result['delta'] = {}
+                for category in categories:
+                    result['delta'][category] = compute_delta(category, facts[category],
+                                                              snapshots.snapshot_path(category, filters))
+            else:
+                result['ansible_facts'] = facts
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
 
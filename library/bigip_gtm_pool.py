@@ -49,18 +49,78 @@ options:
         required: true
     state:
         description:
-            - Pool member state
-        required: true
+            - Pool member state. Required unless pools is given, where it is the
+              default state of entries without one
+        required: false
         choices: ['present', 'absent', 'enabled', 'disabled']
     pool:
         description:
-            - Pool name
-        required: true
+            - Pool name. Required unless pools or members is given
+        required: false
+    pools:
+        description:
+            - List of pools to reconcile in one pass, each a pool name or a dict
+              with name, state (enabled or disabled) and optionally type
+              (defaults to pool_type). Current states are read
+              with one call and only the pools that differ are changed with one
+              call. Returns per pool results in pools
+        required: false
+    members:
+        description:
+            - Desired members of the target pools, each a dict with name and server
+              of the virtual server and optionally pool (defaults to pool) and
+              order. Every pool referenced (of type pool_type) ends up with exactly
+              these members. Names and servers without a folder are taken to be
+              in /Common.
+              Current membership of all target pools is read with one call and the
+              differences applied with one add_member and one remove_member call.
+              Returns per pool added and removed members in members
+        required: false
+    pool_type:
+        description:
+            - Query type of the pools. Pools of different types can share a name
+        required: false
+        default: a
+        choices: ['a', 'aaaa', 'cname', 'mx', 'naptr', 'srv']
     partition:
         description:
             - Partition name
         required: false
         default: Common
+    cache_dir:
+        description:
+            - bigip_gtm_facts_v2 cache directory, entries affected by a change are removed
+        required: false
+        default: ~/.ansible/bigip_gtm_facts
+    index_ttl:
+        description:
+            - Seconds the object lists used for existence checks are kept in
+              cache_dir, 0 lists the objects on every run
+        required: false
+        default: 0
+    wait_timeout:
+        description:
+            - Seconds to wait after an enabled or disabled state is applied until
+              the device reports the matching enabled status (and
+              wait_availability, if set) for every affected object. All objects
+              are polled with one get_object_status call per poll, with
+              exponential backoff. The task fails if they have not converged in
+              time. disabled_by_parent counts as
+              disabled, and the task fails at once when the only objects left
+              are waiting to be enabled under a disabled parent. 0 does not wait
+        required: false
+        default: 0
+    wait_availability:
+        description:
+            - Availability status every affected object must also reach when waiting
+        required: false
+        choices: ['green', 'yellow', 'red', 'blue', 'gray']
+    broker_socket:
+        description:
+            - Unix socket of a bigip_broker process. When it is listening the
+              module reuses the broker's warm client instead of building its own
+        required: false
+        default: ~/.ansible/bigip_broker.sock
 '''
 
 EXAMPLES = '''
@@ -73,6 +133,27 @@ EXAMPLES = '''
       state=disabled
       pool=my_pool
       partition=Common
+
+  - name: Reconcile datacenter pools
+    local_action:
+      module: bigip_gtm_pool
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      pools:
+        - { name: my_pool_mn, state: disabled }
+        - { name: my_pool_va, state: enabled }
+
+  - name: Sync pool members
+    local_action:
+      module: bigip_gtm_pool
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      pool: my_pool
+      members:
+        - { name: my_vs_mn, server: my_server_mn }
+        - { name: my_vs_va, server: my_server_va }
 '''
 try:
     import bigsuds
@@ -81,9 +162,8 @@ except ImportError:
 else:
     bigsuds_found = True
 
-def bigip_api(server, user, password):
-    api = bigsuds.BIGIP(hostname=server, username=user, password=password)
-    return api
+from ansible.module_utils.bigip_common import (POOL_TYPES, ObjectIndex, bigip_api, invalidate_fact_cache,
+                                                qualify, query_type, wait_for_status, wait_failure_message)
 
 def get_pools(api):
     try:
@@ -117,19 +197,135 @@ def set_pool_state(api, pool, state):
     state = "STATE_%s" % state.strip().upper()
     api.GlobalLB.PoolV2.set_enabled_state([pool], [state])
 
-def pool_exists(api, pool):
-    # hack to determine if pool exists
-    result = False
-    try:
-        api.GlobalLB.PoolV2.get_object_status(pools=[pool])
-        result = True
-    except bigsuds.OperationFailed, e:
-        if "was not found" in str(e):
-            result = False
+def get_pool_states(api, pools):
+    states = api.GlobalLB.PoolV2.get_enabled_state(pools)
+    return [s.split('STATE_')[1].lower() for s in states]
+
+def set_pool_states(api, pools, states):
+    states = ["STATE_%s" % s.strip().upper() for s in states]
+    api.GlobalLB.PoolV2.set_enabled_state(pools, states)
+
+def parse_pools(pools, default_state, partition, default_type):
+    # list of (pool name, query type, desired state), later entries override earlier ones
+    desired = {}
+    order = []
+    for entry in pools:
+        if isinstance(entry, dict):
+            name = entry.get('name')
+            state = entry.get('state', default_state)
+            pool_type = str(entry.get('type', default_type)).lower()
         else:
-            # genuine exception
-            raise
-    return result
+            name = entry
+            state = default_state
+            pool_type = default_type
+        if not name:
+            raise ValueError("pools entry needs a name: %s" % entry)
+        if state not in ['enabled', 'disabled']:
+            raise ValueError("state of pool %s must be enabled or disabled, got: %s" % (name, state))
+        if pool_type not in POOL_TYPES:
+            raise ValueError("type of pool %s must be one of %s, got: %s" % (name, ", ".join(POOL_TYPES), pool_type))
+        if partition not in name:
+            name = "/%s/%s" % (partition, name)
+        key = (name, query_type(pool_type))
+        if key not in desired:
+            order.append(key)
+        desired[key] = state
+    return [(name, pool_type, desired[(name, pool_type)]) for name, pool_type in order]
+
+def parse_members(members, default_pool, partition, pool_type):
+    # (pool name, query type) -> list of (name, server, order) in the order given,
+    # member names and servers in the full path form the device reports
+    desired = {}
+    for entry in members:
+        if not isinstance(entry, dict) or not entry.get('name') or not entry.get('server'):
+            raise ValueError("members entry needs a name and a server: %s" % entry)
+        pool = entry.get('pool', default_pool)
+        if not pool:
+            raise ValueError("members entry needs a pool when pool is not set: %s" % entry)
+        if partition not in pool:
+            pool = "/%s/%s" % (partition, pool)
+        desired.setdefault((pool, query_type(pool_type)), []).append(
+            (qualify(entry['name']), qualify(entry['server']), entry.get('order')))
+    if not desired and default_pool:
+        if partition not in default_pool:
+            default_pool = "/%s/%s" % (partition, default_pool)
+        desired[(default_pool, query_type(pool_type))] = []
+    return desired
+
+def sync_pool_members(api, desired, check_mode):
+    # one list, one membership read, at most one add and one remove for all pools
+    pool_ids = list_pool_ids(api)
+    missing = ["%s (%s)" % key for key in sorted(desired) if key not in pool_ids]
+    if missing:
+        raise ValueError("pools do not exist: %s" % ", ".join(missing))
+    pools = sorted(desired)
+    current = api.GlobalLB.PoolV2.get_member([pool_ids[key] for key in pools])
+
+    results = {}
+    add_pools, add_members, remove_pools, remove_members = [], [], [], []
+    for key, members in zip(pools, current):
+        # compare qualified names, removals are sent back as the device listed them
+        existing = dict(((qualify(m['member']['name']), qualify(m['member']['server'])), m)
+                        for m in members)
+        wanted = set((name, server) for name, server, order in desired[key])
+        next_order = max([m['order'] for m in existing.values()] or [-1]) + 1
+        to_add = []
+        for name, server, order in desired[key]:
+            if (name, server) in existing:
+                continue
+            if order is None:
+                order = next_order
+                next_order += 1
+            to_add.append({'member': {'name': name, 'server': server}, 'order': order})
+            existing[(name, server)] = to_add[-1]
+        to_remove = [existing[member]['member'] for member in sorted(existing) if member not in wanted]
+        if to_add:
+            add_pools.append(pool_ids[key])
+            add_members.append(to_add)
+        if to_remove:
+            remove_pools.append(pool_ids[key])
+            remove_members.append(to_remove)
+        results[key[0]] = {'added': [m['member'] for m in to_add], 'removed': to_remove}
+
+    if not check_mode:
+        if add_pools:
+            api.GlobalLB.PoolV2.add_member(pools=add_pools, members=add_members)
+        if remove_pools:
+            api.GlobalLB.PoolV2.remove_member(pools=remove_pools, members=remove_members)
+    return {'changed': bool(add_pools or remove_pools), 'members': results}
+
+def list_pool_ids(api):
+    # pools of different query types may share a name, so ids are keyed by both
+    return dict(((qualify(p['pool_name']), p['pool_type']), p) for p in api.GlobalLB.PoolV2.get_list())
+
+def reconcile_pool_states(api, desired, check_mode):
+    # one list, one read and at most one write regardless of the number of pools
+    pool_ids = list_pool_ids(api)
+    missing = ["%s (%s)" % (name, pool_type) for name, pool_type, state in desired
+               if (name, pool_type) not in pool_ids]
+    if missing:
+        raise ValueError("pools do not exist: %s" % ", ".join(missing))
+    ids = [pool_ids[(name, pool_type)] for name, pool_type, state in desired]
+    current = get_pool_states(api, ids)
+    results = []
+    changes = []
+    for (name, pool_type, state), pool_id, before in zip(desired, ids, current):
+        changed = state != before
+        if changed:
+            changes.append((pool_id, state))
+        results.append({'name': name, 'type': pool_type, 'before': before, 'after': state, 'changed': changed})
+    if changes and not check_mode:
+        set_pool_states(api, [c[0] for c in changes], [c[1] for c in changes])
+    targets = [(pool_id, name, state) for (name, pool_type, state), pool_id in zip(desired, ids)]
+    return {'changed': bool(changes), 'pools': results}, targets
+
+# get_list interface per category and the existence key of each listed item
+INDEX_CATEGORIES = {
+    'pool': ('PoolV2', lambda item: (qualify(item['pool_name']), item['pool_type'])),
+}
+
+def pool_exists(index, pool):
+    return index.exists('pool', (qualify(pool['pool_name']), pool['pool_type']))
 
 def member_exists(api, pool, name, server):
     # hack to determine if member exists
@@ -175,12 +371,20 @@ def main():
             server = dict(type='str', required=True),
             user = dict(type='str', required=True),
             password = dict(type='str', required=True, no_log=True),
-            state = dict(type='str', required=True, choices=['present', 'absent', 'enabled', 'disabled']),
-            pool = dict(type='str', required=True),
+            state = dict(type='str', required=False, choices=['present', 'absent', 'enabled', 'disabled']),
+            pool = dict(type='str', required=False),
+            pools = dict(type='list', required=False),
+            pool_type = dict(type='str', choices=POOL_TYPES, default='a'),
+            members = dict(type='list', required=False),
             partition = dict(type='str', default='Common'),
             virtual_server_server = dict(type='str', required=False),
             virtual_server_name = dict(type='str', required=False),
-            lb_method = dict(type='str', choices=lb_method_choices, default='round_robin')
+            lb_method = dict(type='str', choices=lb_method_choices, default='round_robin'),
+            cache_dir = dict(type='str', default='~/.ansible/bigip_gtm_facts'),
+            index_ttl = dict(type='int', default=0),
+            wait_timeout = dict(type='int', default=0),
+            wait_availability = dict(type='str', choices=['green', 'yellow', 'red', 'blue', 'gray']),
+            broker_socket = dict(type='str', default='~/.ansible/bigip_broker.sock')
         ),
         supports_check_mode=True
     )
@@ -194,23 +398,46 @@ def main():
     state = module.params['state']
     partition = module.params['partition']
 
-    if partition not in module.params['pool']:
+    desired = None
+    desired_members = None
+    if module.params['members'] is not None:
+        try:
+            desired_members = parse_members(module.params['members'], module.params['pool'], partition,
+                                            module.params['pool_type'])
+        except ValueError, e:
+            module.fail_json(msg=str(e))
+    elif module.params['pools']:
+        try:
+            desired = parse_pools(module.params['pools'], state, partition, module.params['pool_type'])
+        except ValueError, e:
+            module.fail_json(msg=str(e))
+    elif module.params['pool'] is None or state is None:
+        module.fail_json(msg="pool and state are required unless pools or members is given")
+    elif partition not in module.params['pool']:
         pool = "/%s/%s" % (partition, module.params['pool'])
     else:
         pool = module.params['pool']
 
-    pool_id = {'pool_name': pool, 'pool_type': 'GTM_QUERY_TYPE_A'}
+    if desired is None and desired_members is None:
+        pool_id = {'pool_name': pool, 'pool_type': query_type(module.params['pool_type'])}
     virtual_server_name = module.params['virtual_server_name']
     virtual_server_server = module.params['virtual_server_server']
     lb_method = module.params['lb_method']
 
     try:
-        api = bigip_api(server, user, password)
+        api = bigip_api(server, user, password, module.params['broker_socket'])
+        index = ObjectIndex(api, module.params['cache_dir'], server, INDEX_CATEGORIES,
+                            module.params['index_ttl'])
 
         result = {'changed': False}  # default
+        targets = []
 
-        if state == 'enabled':
-            if not pool_exists(api, pool_id):
+        if desired_members is not None:
+            result = sync_pool_members(api, desired_members, module.check_mode)
+        elif desired is not None:
+            result, targets = reconcile_pool_states(api, desired, module.check_mode)
+        elif state == 'enabled':
+            if not pool_exists(index, pool_id):
                 module.fail_json(msg="pool %s does not exist" % pool)
             if state != get_pool_state(api, pool_id):
                 if not module.check_mode:
@@ -218,8 +445,9 @@ def main():
                     result = {'changed': True}
                 else:
                     result = {'changed': True}
+            targets = [(pool_id, pool, state)]
         elif state == 'disabled':
-            if not pool_exists(api, pool_id):
+            if not pool_exists(index, pool_id):
                 module.fail_json(msg="pool %s does not exist" % pool)
             if state != get_pool_state(api, pool_id):
                 if not module.check_mode:
@@ -227,9 +455,21 @@ def main():
                     result = {'changed': True}
                 else:
                     result = {'changed': True}
+            targets = [(pool_id, pool, state)]
+
+        if targets and module.params['wait_timeout'] > 0 and not module.check_mode:
+            result['wait'] = wait_for_status(api.GlobalLB.PoolV2.get_object_status, targets,
+                                             module.params['wait_availability'],
+                                             module.params['wait_timeout'])
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
 
+    if result['changed'] and not module.check_mode:
+        invalidate_fact_cache(module.params['cache_dir'], server, ['pool'])
+
+    if 'wait' in result and not result['wait']['converged']:
+        module.fail_json(msg=wait_failure_message(result['wait'], module.params['wait_timeout']), **result)
+
     module.exit_json(**result)
 
 # import module snippets
@@ -49,17 +49,28 @@ options:
         required: true
     state:
         description:
-            - Virtual server state
-        required: true
+            - Virtual server state, the default state of virtual_servers entries
+        required: false
         choices: ['present', 'absent','enabled','disabled']
     virtual_server_name:
         description:
-            - Virtual server name
-        required: True
+            - Virtual server name. Required unless virtual_servers is given
+        required: false
     virtual_server_server:
         description:
-            - Virtual server server
-        required: true
+            - Virtual server server. Required unless virtual_servers is given
+        required: false
+    virtual_servers:
+        description:
+            - List of virtual servers to manage in one run, each a dict with
+              name, server, host, port and state (defaults to state, then
+              present). Parent servers and existing virtual servers are looked
+              up with one list call each, then all creations and all deletions
+              are sent as one call each. An entry repeated for the same name
+              and server is applied once, and the task fails if the repeats
+              disagree on state, host or port. Returns the changed entries in
+              virtual_servers
+        required: false
     host:
         description:
             - Virtual server host
@@ -69,9 +80,54 @@ options:
         description:
             - Virtual server port
         required: false
+    cache_dir:
+        description:
+            - bigip_gtm_facts_v2 cache directory, entries affected by a change are removed
+        required: false
+        default: ~/.ansible/bigip_gtm_facts
+    index_ttl:
+        description:
+            - Seconds the object lists used for existence checks are kept in
+              cache_dir, 0 lists the objects on every run
+        required: false
+        default: 0
+    wait_timeout:
+        description:
+            - Seconds to wait after an enabled or disabled state is applied until
+              the device reports the matching enabled status (and
+              wait_availability, if set) for every affected virtual server. All
+              of them are polled with one get_object_status call per poll, with
+              exponential backoff. The task fails if they have not converged in
+              time. disabled_by_parent counts as
+              disabled, and the task fails at once when the only objects left
+              are waiting to be enabled under a disabled parent. 0 does not wait
+        required: false
+        default: 0
+    wait_availability:
+        description:
+            - Availability status every affected virtual server must also reach when waiting
+        required: false
+        choices: ['green', 'yellow', 'red', 'blue', 'gray']
+    broker_socket:
+        description:
+            - Unix socket of a bigip_broker process. When it is listening the
+              module reuses the broker's warm client instead of building its own
+        required: false
+        default: ~/.ansible/bigip_broker.sock
 '''
 
 EXAMPLES = '''
+  - name: Onboard datacenter virtual servers
+    local_action:
+      module: bigip_gtm_virtual_server
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      virtual_servers:
+        - { name: vs_www, server: dc3_ltm, host: 10.3.0.10, port: 80 }
+        - { name: vs_api, server: dc3_ltm, host: 10.3.0.11, port: 443 }
+        - { name: vs_old, server: dc1_ltm, state: absent }
+
   - name: Enable virtual server
     local_action: >
       bigip_gtm_virtual_server
@@ -90,38 +146,88 @@ except ImportError:
 else:
     bigsuds_found = True
 
-def bigip_api(server, user, password):
-    api = bigsuds.BIGIP(hostname=server, username=user, password=password)
-    return api
-    
-def server_exists(api, server):
-    # hack to determine if virtual server exists
-    result = False
-    try:
-        api.GlobalLB.Server.get_object_status([server])
-        result = True
-    except bigsuds.OperationFailed, e:
-        if "was not found" in str(e):
-            result = False
-        else:
-            # genuine exception
-            raise
-    return result
-
-def virtual_server_exists(api, name, server):
-    # hack to determine if virtual server exists
-    result = False
-    try:
-        virtual_server_id = {'name': name, 'server': server}
-        api.GlobalLB.VirtualServerV2.get_object_status([virtual_server_id])
-        result = True
-    except bigsuds.OperationFailed, e:
-        if "was not found" in str(e):
-            result = False
-        else:
-            # genuine exception
-            raise
-    return result
+from ansible.module_utils.bigip_common import (ObjectIndex, bigip_api, invalidate_fact_cache,
+                                                qualify, wait_for_status, wait_failure_message)
+
+# get_list interface per category and the existence key of each listed item
+INDEX_CATEGORIES = {
+    'server': ('Server', lambda item: qualify(item)),
+    'virtual_server': ('VirtualServerV2', lambda item: (qualify(item['name']), qualify(item['server']))),
+}
+
+def server_exists(index, server):
+    return index.exists('server', qualify(server))
+
+def virtual_server_exists(index, name, server):
+    return index.exists('virtual_server', (qualify(name), qualify(server)))
+
+def parse_virtual_servers(virtual_servers, default_state):
+    # list of (virtual server id, address, state, "server:name"), one per
+    # server and name. Repeated entries are merged and must agree
+    entries = []
+    positions = {}
+    for entry in virtual_servers:
+        if not isinstance(entry, dict) or not entry.get('name') or not entry.get('server'):
+            raise ValueError("virtual_servers entry needs a name and a server: %s" % entry)
+        state = entry.get('state', default_state) or 'present'
+        if state not in ['present', 'absent', 'enabled', 'disabled']:
+            raise ValueError("state must be present, absent, enabled or disabled, got: %s" % state)
+        address = None
+        host = entry.get('host', entry.get('address'))
+        if state == 'present' and host and entry.get('port'):
+            address = {'address': host, 'port': int(entry['port'])}
+        virtual_server_id = {'name': entry['name'], 'server': entry['server']}
+        label = "%s:%s" % (entry['server'], entry['name'])
+        key = (entry['name'], entry['server'])
+        if key in positions:
+            _, seen_address, seen_state, _ = entries[positions[key]]
+            if seen_state != state or (address and seen_address and address != seen_address):
+                raise ValueError("virtual server %s is listed more than once with different settings" % label)
+            if address and not seen_address:
+                entries[positions[key]] = (virtual_server_id, address, state, label)
+            continue
+        positions[key] = len(entries)
+        entries.append((virtual_server_id, address, state, label))
+    return entries
+
+def provision_virtual_servers(api, index, entries, check_mode):
+    creates, deletes, toggles, changed = [], [], [], []
+    missing = set()
+    for virtual_server_id, address, state, label in entries:
+        exists = virtual_server_exists(index, virtual_server_id['name'], virtual_server_id['server'])
+        if state == 'present' and not exists:
+            if address is None:
+                raise ValueError("host and port are required to create virtual server %s" % label)
+            if not server_exists(index, virtual_server_id['server']):
+                missing.add(virtual_server_id['server'])
+            creates.append((virtual_server_id, address))
+            changed.append({'name': label, 'state': 'present'})
+        elif state == 'absent' and exists:
+            deletes.append(virtual_server_id)
+            changed.append({'name': label, 'state': 'absent'})
+        elif state in ['enabled', 'disabled']:
+            if not exists:
+                raise ValueError("virtual server %s does not exist" % label)
+            toggles.append((virtual_server_id, state, label))
+    if missing:
+        raise ValueError("servers do not exist: %s" % ", ".join(sorted(missing)))
+
+    targets = [(virtual_server_id, label, state) for virtual_server_id, state, label in toggles]
+    if toggles:
+        current = api.GlobalLB.VirtualServerV2.get_enabled_state([t[0] for t in toggles])
+        toggles = [t for t, before in zip(toggles, current)
+                   if t[1] != before.split('STATE_')[1].lower()]
+        changed.extend({'name': label, 'state': state} for _, state, label in toggles)
+
+    if not check_mode:
+        if deletes:
+            api.GlobalLB.VirtualServerV2.delete_virtual_server(deletes)
+        if creates:
+            api.GlobalLB.VirtualServerV2.create([c[0] for c in creates], [c[1] for c in creates])
+        if toggles:
+            api.GlobalLB.VirtualServerV2.set_enabled_state(
+                [t[0] for t in toggles], ["STATE_%s" % t[1].upper() for t in toggles])
+    return {'changed': bool(changed), 'virtual_servers': changed}, targets
 
 def add_virtual_server(api, virtual_server_name, virtual_server_server, address, port):
     addresses = {'address': address, 'port': port}
@@ -149,11 +255,17 @@ def main():
             server = dict(type='str', required=True),
             user = dict(type='str', required=True),
             password = dict(type='str', required=True, no_log=True),
-            state = dict(type='str', required=True, choices=['present', 'absent', 'enabled', 'disabled']),
+            state = dict(type='str', required=False, choices=['present', 'absent', 'enabled', 'disabled']),
             host =  dict(type='str', aliases=['address']),
             port = dict(type='int'),
-            virtual_server_name = dict(type='str', required=True),
-            virtual_server_server = dict(type='str', required=True)
+            virtual_server_name = dict(type='str', required=False),
+            virtual_server_server = dict(type='str', required=False),
+            virtual_servers = dict(type='list', required=False),
+            cache_dir = dict(type='str', default='~/.ansible/bigip_gtm_facts'),
+            index_ttl = dict(type='int', default=0),
+            wait_timeout = dict(type='int', default=0),
+            wait_availability = dict(type='str', choices=['green', 'yellow', 'red', 'blue', 'gray']),
+            broker_socket = dict(type='str', default='~/.ansible/bigip_broker.sock')
         ),
         supports_check_mode=True
     )
@@ -170,13 +282,27 @@ def main():
     address = module.params['host']
     port = module.params['port']
 
+    entries = None
+    if module.params['virtual_servers']:
+        try:
+            entries = parse_virtual_servers(module.params['virtual_servers'], state)
+        except ValueError, e:
+            module.fail_json(msg=str(e))
+    elif not (virtual_server_name and virtual_server_server and state):
+        module.fail_json(msg="virtual_server_name, virtual_server_server and state are required unless virtual_servers is given")
+
     result = {'changed': False}  # default
 
     try:
-        api = bigip_api(server, user, password)
+        api = bigip_api(server, user, password, module.params['broker_socket'])
+        index = ObjectIndex(api, module.params['cache_dir'], server, INDEX_CATEGORIES,
+                            module.params['index_ttl'])
+        targets = []
 
-        if state == 'absent':
-            if virtual_server_exists(api, virtual_server_name, virtual_server_server):
+        if entries is not None:
+            result, targets = provision_virtual_servers(api, index, entries, module.check_mode)
+        elif state == 'absent':
+            if virtual_server_exists(index, virtual_server_name, virtual_server_server):
                 if not module.check_mode:
                     remove_virtual_server(api, virtual_server_name, virtual_server_server)
                     result = {'changed': True}
@@ -185,9 +311,9 @@ def main():
                     result = {'changed': True}
         elif state == 'present':
             if virtual_server_name and virtual_server_server and address and port:
-                if not virtual_server_exists(api, virtual_server_name, virtual_server_server):
+                if not virtual_server_exists(index, virtual_server_name, virtual_server_server):
                     if not module.check_mode:
-                        if server_exists(api, virtual_server_server):
+                        if server_exists(index, virtual_server_server):
                             add_virtual_server(api, virtual_server_name, virtual_server_server, address, port)
                             result = {'changed': True}
                         else: 
@@ -201,7 +327,7 @@ def main():
             else:
                 module.fail_json(msg="Address and port are required to create virtual server")
         elif state == 'enabled':
-            if not virtual_server_exists(api, virtual_server_name, virtual_server_server):
+            if not virtual_server_exists(index, virtual_server_name, virtual_server_server):
                 module.fail_json(msg="virtual server does not exist")
             if state != get_virtual_server_state(api, virtual_server_name, virtual_server_server):
                 if not module.check_mode:
@@ -209,8 +335,10 @@ def main():
                     result = {'changed': True}
                 else:
                     result = {'changed': True}
+            targets = [({'name': virtual_server_name, 'server': virtual_server_server},
+                        "%s:%s" % (virtual_server_server, virtual_server_name), state)]
         elif state == 'disabled':
-            if not virtual_server_exists(api, virtual_server_name, virtual_server_server):
+            if not virtual_server_exists(index, virtual_server_name, virtual_server_server):
                 module.fail_json(msg="virtual server does not exist")
             if state != get_virtual_server_state(api, virtual_server_name, virtual_server_server):
                 if not module.check_mode:
@@ -218,10 +346,23 @@ def main():
                     result = {'changed': True}
                 else:
                     result = {'changed': True}
+            targets = [({'name': virtual_server_name, 'server': virtual_server_server},
+                        "%s:%s" % (virtual_server_server, virtual_server_name), state)]
+
+        if targets and module.params['wait_timeout'] > 0 and not module.check_mode:
+            result['wait'] = wait_for_status(api.GlobalLB.VirtualServerV2.get_object_status, targets,
+                                             module.params['wait_availability'],
+                                             module.params['wait_timeout'])
 
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
 
+    if result['changed'] and not module.check_mode:
+        invalidate_fact_cache(module.params['cache_dir'], server, ['virtual_server', 'pool'])
+
+    if 'wait' in result and not result['wait']['converged']:
+        module.fail_json(msg=wait_failure_message(result['wait'], module.params['wait_timeout']), **result)
+
     module.exit_json(**result)
 
 # import module snippets
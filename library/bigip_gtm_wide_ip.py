@@ -49,8 +49,8 @@ options:
         required: true
     lb_method:
         description:
-            - LB method of wide ip
-        required: true
+            - LB method of wide ip, or of every wide ip matching wide_ip_regex
+        required: false
         choices: ['return_to_dns', 'null', 'round_robin',
                       'ratio', 'topology', 'static_persist', 'global_availability',
                       'vs_capacity', 'least_conn', 'lowest_rtt', 'lowest_hops',
@@ -58,8 +58,36 @@ options:
                       'drop_packet', 'explicit_ip', 'connection_rate', 'vs_score']
     wide_ip:
         description:
-            - Wide IP name
-        required: true
+            - Wide IP name. One of wide_ip, wide_ips or wide_ip_regex is required
+        required: false
+    wide_ips:
+        description:
+            - Mapping of wide ip names to lb methods. All current methods are read
+              with one call and the differences set with one call, changes are
+              returned per wide ip in wide_ips
+        required: false
+    wide_ip_regex:
+        description:
+            - Regular expression selecting the wide ips set to lb_method, matched
+              with re.search against the full path of every wide ip on the device
+        required: false
+    cache_dir:
+        description:
+            - bigip_gtm_facts_v2 cache directory, entries affected by a change are removed
+        required: false
+        default: ~/.ansible/bigip_gtm_facts
+    index_ttl:
+        description:
+            - Seconds the object lists used for existence checks are kept in
+              cache_dir, 0 lists the objects on every run
+        required: false
+        default: 0
+    broker_socket:
+        description:
+            - Unix socket of a bigip_broker process. When it is listening the
+              module reuses the broker's warm client instead of building its own
+        required: false
+        default: ~/.ansible/bigip_broker.sock
 '''
 
 EXAMPLES = '''
@@ -71,6 +99,25 @@ EXAMPLES = '''
       password=mysecret
       lb_method=round_robin
       wide_ip=my_wide_ip
+
+  - name: Move DR wide ips to global availability
+    local_action:
+      module: bigip_gtm_wide_ip
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      wide_ip_regex: '\.dr\.example\.com$'
+      lb_method: global_availability
+
+  - name: Set lb methods
+    local_action:
+      module: bigip_gtm_wide_ip
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      wide_ips:
+        www.example.com: topology
+        api.example.com: round_robin
 '''
 
 try:
@@ -80,9 +127,15 @@ except ImportError:
 else:
     bigsuds_found = True
 
-def bigip_api(server, user, password):
-    api = bigsuds.BIGIP(hostname=server, username=user, password=password)
-    return api
+import re
+
+from ansible.module_utils.bigip_common import ObjectIndex, bigip_api, invalidate_fact_cache, qualify
+
+lb_method_choices = ['return_to_dns', 'null', 'round_robin',
+                     'ratio', 'topology', 'static_persist', 'global_availability',
+                     'vs_capacity', 'least_conn', 'lowest_rtt', 'lowest_hops',
+                     'packet_rate', 'cpu', 'hit_ratio', 'qos', 'bps',
+                     'drop_packet', 'explicit_ip', 'connection_rate', 'vs_score']
 
 def get_wide_ip_lb_method(api, wide_ip):
     lb_method = api.GlobalLB.WideIP.get_lb_method(wide_ips=[wide_ip])[0]
@@ -95,39 +148,65 @@ def get_wide_ip_pools(api, wide_ip):
     except Exception, e:
         print e
 
-def wide_ip_exists(api, wide_ip):
-    # hack to determine if wide_ip exists
-    result = False
-    try:
-        api.GlobalLB.WideIP.get_object_status(wide_ips=[wide_ip])
-        result = True
-    except bigsuds.OperationFailed, e:
-        if "was not found" in str(e):
-            result = False
-        else:
-            # genuine exception
-            raise
-    return result
+# get_list interface per category and the existence key of each listed item
+INDEX_CATEGORIES = {
+    'wide_ip': ('WideIP', lambda item: qualify(item)),
+}
+
+def wide_ip_exists(index, wide_ip):
+    return index.exists('wide_ip', qualify(wide_ip))
 
 def set_wide_ip_lb_method(api, wide_ip, lb_method):
     lb_method = "LB_METHOD_%s" % lb_method.strip().upper()
     api.GlobalLB.WideIP.set_lb_method(wide_ips=[wide_ip], lb_methods=[lb_method])
 
-def main():
+def select_wide_ips(index, wide_ips, wide_ip_regex, lb_method):
+    # list of (wide ip, lb method) from the mapping or the regex selector
+    if wide_ips is not None:
+        for name, method in wide_ips.items():
+            if method not in lb_method_choices:
+                raise ValueError("lb_method of wide ip %s must be one of: %s, got: %s" %
+                                 (name, ",".join(lb_method_choices), method))
+        missing = sorted(name for name in wide_ips if not wide_ip_exists(index, name))
+        if missing:
+            raise ValueError("wide ips do not exist: %s" % ", ".join(missing))
+        return sorted(wide_ips.items())
+    try:
+        selector = re.compile(wide_ip_regex)
+    except re.error, e:
+        raise ValueError("invalid wide_ip_regex: %s" % e)
+    return [(name, lb_method) for name in sorted(index.get('wide_ip')) if selector.search(name)]
 
-    lb_method_choices = ['return_to_dns', 'null', 'round_robin',
-                                    'ratio', 'topology', 'static_persist', 'global_availability',
-                                    'vs_capacity', 'least_conn', 'lowest_rtt', 'lowest_hops',
-                                    'packet_rate', 'cpu', 'hit_ratio', 'qos', 'bps',
-                                    'drop_packet', 'explicit_ip', 'connection_rate', 'vs_score']
+def reconcile_lb_methods(api, desired, check_mode):
+    # one read and at most one write regardless of the number of wide ips
+    results = []
+    changes = []
+    if desired:
+        current = api.GlobalLB.WideIP.get_lb_method(wide_ips=[d[0] for d in desired])
+        for (name, lb_method), before in zip(desired, current):
+            before = before.strip().replace('LB_METHOD_', '').lower()
+            changed = lb_method != before
+            if changed:
+                changes.append((name, "LB_METHOD_%s" % lb_method.upper()))
+            results.append({'name': name, 'before': before, 'after': lb_method, 'changed': changed})
+    if changes and not check_mode:
+        api.GlobalLB.WideIP.set_lb_method(wide_ips=[c[0] for c in changes],
+                                          lb_methods=[c[1] for c in changes])
+    return {'changed': bool(changes), 'wide_ips': results}
 
+def main():
     module = AnsibleModule(
         argument_spec = dict(
             server = dict(type='str', required=True),
             user = dict(type='str', required=True),
             password = dict(type='str', required=True, no_log=True),
-            lb_method = dict(type='str', required=True, choices=lb_method_choices),
-            wide_ip = dict(type='str', required=True)
+            lb_method = dict(type='str', required=False, choices=lb_method_choices),
+            wide_ip = dict(type='str', required=False),
+            wide_ips = dict(type='dict', required=False),
+            wide_ip_regex = dict(type='str', required=False),
+            cache_dir = dict(type='str', default='~/.ansible/bigip_gtm_facts'),
+            index_ttl = dict(type='int', default=0),
+            broker_socket = dict(type='str', default='~/.ansible/bigip_broker.sock')
         ),
         supports_check_mode=True
     )
@@ -140,25 +219,44 @@ def main():
     password = module.params['password']
     wide_ip = module.params['wide_ip']
     lb_method = module.params['lb_method']
+    wide_ips = module.params['wide_ips']
+    wide_ip_regex = module.params['wide_ip_regex']
+
+    if len([p for p in [wide_ip, wide_ips, wide_ip_regex] if p is not None]) != 1:
+        module.fail_json(msg="exactly one of wide_ip, wide_ips and wide_ip_regex is required")
+    if wide_ips is None and lb_method is None:
+        module.fail_json(msg="lb_method is required with wide_ip and wide_ip_regex")
 
     result = {'changed': False}  # default
 
     try:
-        api = bigip_api(server, user, password)
+        api = bigip_api(server, user, password, module.params['broker_socket'])
+        index = ObjectIndex(api, module.params['cache_dir'], server, INDEX_CATEGORIES,
+                            module.params['index_ttl'])
 
-        if not wide_ip_exists(api, wide_ip):
-            module.fail_json(msg="wide ip %s does not exist" % wide_ip)
+        if wide_ip is None:
+            try:
+                desired = select_wide_ips(index, wide_ips, wide_ip_regex, lb_method)
+            except ValueError, e:
+                module.fail_json(msg=str(e))
+            result = reconcile_lb_methods(api, desired, module.check_mode)
+        else:
+            if not wide_ip_exists(index, wide_ip):
+                module.fail_json(msg="wide ip %s does not exist" % wide_ip)
 
-        if lb_method is not None and lb_method != get_wide_ip_lb_method(api, wide_ip):
-            if not module.check_mode:
-                set_wide_ip_lb_method(api, wide_ip, lb_method)
-                result = {'changed': True}
-            else:
-                result = {'changed': True}
+            if lb_method is not None and lb_method != get_wide_ip_lb_method(api, wide_ip):
+                if not module.check_mode:
+                    set_wide_ip_lb_method(api, wide_ip, lb_method)
+                    result = {'changed': True}
+                else:
+                    result = {'changed': True}
 
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
 
+    if result['changed'] and not module.check_mode:
+        invalidate_fact_cache(module.params['cache_dir'], server, ['wide_ip'])
+
     module.exit_json(**result)
 
 # import module snippets
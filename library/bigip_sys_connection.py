@@ -57,10 +57,67 @@ options:
         aliases: []
     command:
         description:
-            - Command to run
-        required: true
+            - Command to run. One of command, commands and drain is required
+        required: false
+        choices: []
+        aliases: []
+    commands:
+        description:
+            - List of commands to run over one authenticated session. Each
+              command's output (parsed as set by output) and elapsed seconds are
+              returned in results. Run in order by default, stopping at the first
+              failure
+        required: false
+        choices: []
+        aliases: []
+    parallel:
+        description:
+            - Number of commands run at the same time on a thread pool, for
+              commands that do not depend on each other
+        required: false
+        default: 1
+        choices: []
+        aliases: []
+    merge:
+        description:
+            - Run commands as one bash invocation, separated by markers so their
+              output, exit codes and elapsed seconds (timed on the device) are
+              still returned per command in results
+        required: false
+        default: false
+        choices: []
+        aliases: []
+    drain:
+        description:
+            - tmsh connection selector, for example ss-server-addr 10.0.0.5.
+              Deletes the matching connections once, then counts them on the same
+              session until none are left or drain_timeout passes. Polls follow
+              the observed drain rate, backing off while the count does not fall.
+              Counts are read from the Total records returned line, and output
+              without it (for example a tmsh error) fails the task. Returns
+              drained and the observed counts in counts
+        required: false
+        choices: []
+        aliases: []
+    drain_timeout:
+        description:
+            - Seconds to wait for the connections to drain before failing
+        required: false
+        default: 60
         choices: []
         aliases: []
+    output:
+        description:
+            - How the output of a tmsh show sys connection command is returned.
+              raw returns it unparsed in msg. records parses it line by line into
+              connections, a list of dicts with cs_client, cs_server, ss_client,
+              ss_server, protocol, idle and tmm. count returns only the summary
+              (connection_count, total_records and protocols) without building
+              records
+        required: false
+        default: raw
+        choices: ['raw', 'records', 'count']
+        aliases: []
 '''
 
 EXAMPLES = '''
@@ -71,20 +128,219 @@ EXAMPLES = '''
       user={{ f5_ltm_username }}
       password={{ f5_ltm_password }}
       command="tmsh show sys connection cs-server-addr {{ ip_address }}"
+
+- name: Count connections to node
+  local_action: >
+      bigip_sys_connection
+      server={{ f5_ltm_server }}
+      user={{ f5_ltm_username }}
+      password={{ f5_ltm_password }}
+      command="tmsh show sys connection ss-server-addr {{ ip_address }}"
+      output=count
+  register: node_connections
+  failed_when: node_connections.connection_count != 0
+
+- name: Drop connections to node and wait for them to drain
+  local_action: >
+      bigip_sys_connection
+      server={{ f5_ltm_server }}
+      user={{ f5_ltm_username }}
+      password={{ f5_ltm_password }}
+      drain="ss-server-addr {{ ip_address }}"
+      drain_timeout=30
+
+- name: Collect node diagnostics
+  local_action:
+    module: bigip_sys_connection
+    server: "{{ f5_ltm_server }}"
+    user: "{{ f5_ltm_username }}"
+    password: "{{ f5_ltm_password }}"
+    parallel: 3
+    commands:
+      - "tmsh show ltm node {{ ip_address }}"
+      - "tmsh show ltm pool members"
+      - "tmsh show sys connection ss-server-addr {{ ip_address }}"
 '''
+
+import re
+import threading
+import time
+import uuid
+
 try:
     from f5.bigip import ManagementRoot
+    from f5.bigip.tm.util.bash import Bash
     HAS_F5SDK = True
 except ImportError:
     HAS_F5SDK = False
 
+CONNECTION_FIELDS = ['cs_client', 'cs_server', 'ss_client', 'ss_server', 'protocol', 'idle', 'tmm']
+CONNECTION_LINE = re.compile(r'^\s*(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\d+)\s+\(tmm:\s*(\d+)\)')
+TOTAL_LINE = re.compile(r'Total records returned:\s*(\d+)')
+
+
+def iter_lines(text):
+    # walk the output one line at a time instead of splitting it into a list
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
+def parse_connections(text, records=True):
+    # the count comes from tmsh's own total, connection lines only stand in for
+    # it when the total is missing; output with neither is an error, not zero
+    summary = {'connection_count': 0, 'total_records': None, 'protocols': {}}
+    connections = []
+    for line in iter_lines(text):
+        match = CONNECTION_LINE.match(line)
+        if match:
+            summary['connection_count'] += 1
+            protocol = match.group(5)
+            summary['protocols'][protocol] = summary['protocols'].get(protocol, 0) + 1
+            if records:
+                connection = dict(zip(CONNECTION_FIELDS, match.groups()))
+                connection['idle'] = int(connection['idle'])
+                connection['tmm'] = int(connection['tmm'])
+                connections.append(connection)
+            continue
+        match = TOTAL_LINE.search(line)
+        if match:
+            summary['total_records'] = int(match.group(1))
+    if summary['total_records'] is not None:
+        summary['connection_count'] = summary['total_records']
+    elif not summary['connection_count']:
+        raise F5ModuleError("no connections or record total in output: {0}".format(text.strip()[:200]))
+    if records:
+        summary['connections'] = connections
+    return summary
+
+
+def run_command(bash, command):
+    output = bash.exec_cmd('run', utilCmdArgs='-c "{0}"'.format(command))
+    return getattr(output, 'commandResult', '')
+
+
+def timed_command(bash, command):
+    start = time.time()
+    try:
+        result = {'command': command, 'output': run_command(bash, command), 'failed': False}
+    except Exception as e:
+        result = {'command': command, 'msg': str(e), 'failed': True}
+    result['elapsed'] = round(time.time() - start, 3)
+    return result
+
+
+def run_sequence(mgmt, commands):
+    results = []
+    for command in commands:
+        results.append(timed_command(mgmt.tm.util.bash, command))
+        if results[-1]['failed']:
+            break
+    return results
+
+
+def run_parallel(mgmt, commands, workers):
+    # every worker gets its own bash resource, exec_cmd stores its response on
+    # the resource, while the authenticated session underneath is shared
+    results = [None] * len(commands)
+    pending = list(enumerate(commands))
+    lock = threading.Lock()
+
+    def work():
+        bash = Bash(mgmt.tm.util)
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index, command = pending.pop(0)
+            results[index] = timed_command(bash, command)
+
+    threads = [threading.Thread(target=work) for _ in range(min(workers, len(commands)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_merged(mgmt, commands):
+    # one bash invocation. A start marker, then after every command a marker
+    # line with its exit code and the time, on a line of its own even when the
+    # output does not end in a newline. Elapsed is the time between markers
+    marker = '__bigip_sys_connection_{0}__'.format(uuid.uuid4().hex)
+    script = 'echo {0} 0 $(date +%s.%N)'.format(marker)
+    for command in commands:
+        script += ' ; {0} ; rc=$? ; echo ; echo {1} $rc $(date +%s.%N)'.format(command, marker)
+    output = run_command(mgmt.tm.util.bash, script)
+    # [before, 0, start, output, rc, time, output, rc, time, ...]
+    parts = re.split(r'\n?{0} (\d+) ([\d.]+)\n?'.format(marker), output)
+    results = []
+    for index, command in enumerate(commands):
+        position = 3 * index + 3
+        if position + 2 < len(parts):
+            rc = int(parts[position + 1])
+            elapsed = float(parts[position + 2]) - float(parts[position - 1])
+            results.append({'command': command, 'output': parts[position], 'rc': rc, 'failed': rc != 0,
+                            'elapsed': round(elapsed, 3)})
+        else:
+            results.append({'command': command, 'msg': 'no exit code in merged output', 'failed': True})
+    return results
+
+
+def record_total(output, command):
+    match = TOTAL_LINE.search(output)
+    if match is None:
+        raise F5ModuleError("no record total in output of {0}: {1}".format(command, output.strip()[:200]))
+    return int(match.group(1))
+
+
+def drain_connections(mgmt, selector, timeout, min_interval=0.5, max_interval=5.0):
+    # delete once, then poll the count until it is zero or the deadline passes,
+    # sleeping for the projected time to zero while the count falls and
+    # backing off while it does not
+    command = 'tmsh delete sys connection {0}'.format(selector)
+    output = run_command(mgmt.tm.util.bash, command)
+    if output.strip():
+        # a successful delete prints nothing, anything else has to be a summary
+        record_total(output, command)
+    command = 'tmsh show sys connection {0}'.format(selector)
+    start = time.time()
+    deadline = start + timeout
+    interval = min_interval
+    counts = []
+    while True:
+        count = record_total(run_command(mgmt.tm.util.bash, command), command)
+        now = time.time()
+        counts.append({'elapsed': round(now - start, 3), 'count': count})
+        if count == 0 or now >= deadline:
+            return count == 0, counts
+        previous = counts[-2] if len(counts) > 1 else None
+        if previous and count < previous['count'] and counts[-1]['elapsed'] > previous['elapsed']:
+            rate = (previous['count'] - count) / (counts[-1]['elapsed'] - previous['elapsed'])
+            interval = count / rate
+        else:
+            interval *= 2
+        interval = max(min_interval, min(interval, max_interval))
+        time.sleep(min(interval, deadline - now))
+
+
 def main():
     if not HAS_F5SDK:
         raise F5ModuleError("The python f5-sdk module is required")
     argument_spec = f5_argument_spec()
 
     meta_args = dict(
-        command=dict(type='str', required=True),
+        command=dict(type='str', required=False),
+        commands=dict(type='list', required=False),
+        parallel=dict(type='int', default=1),
+        merge=dict(type='bool', default=False),
+        drain=dict(type='str', required=False),
+        drain_timeout=dict(type='int', default=60),
+        output=dict(type='str', default='raw', choices=['raw', 'records', 'count']),
     )
     argument_spec.update(meta_args)
 
@@ -97,23 +353,65 @@ def main():
     password = module.params['password']
     # server_port = module.params['server_port']
     # validate_certs = module.params['validate_certs']
-    command = '-c "{0}"'.format(module.params['command'])
-    
+    commands = module.params['commands']
+    drain = module.params['drain']
+
+    if len([p for p in [module.params['command'], commands, drain] if p is not None]) != 1:
+        module.fail_json(msg="exactly one of command, commands and drain is required")
+    if module.params['parallel'] < 1:
+        module.fail_json(msg="parallel must be at least 1")
+    if module.params['merge'] and module.params['parallel'] > 1:
+        module.fail_json(msg="merge and parallel are mutually exclusive")
+
     result = {}
     result['changed'] = False
-    
+
     try:
         mgmt = ManagementRoot(server, user, password)
-        output = mgmt.tm.util.bash.exec_cmd('run', utilCmdArgs=command)
-    
-        if hasattr(output, 'commandResult'):
-            result['msg'] = output.commandResult
+
+        if commands is not None:
+            start = time.time()
+            if module.params['merge']:
+                result['results'] = run_merged(mgmt, commands)
+            elif module.params['parallel'] > 1:
+                result['results'] = run_parallel(mgmt, commands, module.params['parallel'])
+            else:
+                result['results'] = run_sequence(mgmt, commands)
+            result['elapsed'] = round(time.time() - start, 3)
+            if module.params['output'] != 'raw':
+                for command_result in result['results']:
+                    if 'output' in command_result:
+                        try:
+                            command_result.update(parse_connections(command_result.pop('output'),
+                                                                    module.params['output'] == 'records'))
+                        except F5ModuleError as e:
+                            command_result.update(msg=str(e), failed=True)
+        elif drain is not None:
+            result['drained'], result['counts'] = drain_connections(mgmt, drain, module.params['drain_timeout'])
+            result['connection_count'] = result['counts'][-1]['count']
+        else:
+            command = '-c "{0}"'.format(module.params['command'])
+            output = mgmt.tm.util.bash.exec_cmd('run', utilCmdArgs=command)
+
+            command_result = getattr(output, 'commandResult', '')
+            if module.params['output'] == 'raw':
+                if hasattr(output, 'commandResult'):
+                    result['msg'] = command_result
+            else:
+                result.update(parse_connections(command_result, module.params['output'] == 'records'))
 
         result['changed'] = True
 
     except Exception as e:
         module.fail_json(msg="received exception: {0}".format(e))
 
+    failed = [r['command'] for r in result.get('results', []) if r['failed']]
+    if failed:
+        module.fail_json(msg="commands failed: {0}".format(', '.join(failed)), **result)
+    if drain is not None and not result['drained']:
+        module.fail_json(msg="{0} connections left after {1} seconds".format(
+            result['connection_count'], module.params['drain_timeout']), **result)
+
     module.exit_json(**result)
 
 
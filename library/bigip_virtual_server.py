@@ -54,8 +54,38 @@ options:
         choices: ['present', 'absent','enabled','disabled']
     name:
         description:
-            - Virtual server name
-        required: True
+            - Virtual server name. One of name and names is required
+        required: false
+    names:
+        description:
+            - List of full path virtual server names, possibly in several
+              partitions, all set to state. Every partition is checked and its
+              states read with one call before any state is set, so a missing
+              virtual server fails the task without changing the others. Each
+              partition's changes are then set with one call. Returns before and
+              after state per virtual server in virtual_servers
+        required: false
+    wait_timeout:
+        description:
+            - Seconds to wait after the state is applied until the device reports
+              the matching enabled status (and wait_availability, if set), polling
+              get_object_status with exponential backoff. The task fails if the
+              virtual server has not converged in time. disabled_by_parent counts as
+              disabled, and the task fails at once when the only objects left
+              are waiting to be enabled under a disabled parent. 0 does not wait
+        required: false
+        default: 0
+    wait_availability:
+        description:
+            - Availability status the virtual server must also reach when waiting
+        required: false
+        choices: ['green', 'yellow', 'red', 'blue', 'gray']
+    broker_socket:
+        description:
+            - Unix socket of a bigip_broker process. When it is listening the
+              module reuses the broker's warm client instead of building its own
+        required: false
+        default: ~/.ansible/bigip_broker.sock
 '''
 
 EXAMPLES = '''
@@ -67,6 +97,17 @@ EXAMPLES = '''
       password=mysecret
       name=myname
       state=enabled
+
+  - name: Disable virtual servers in several partitions
+    local_action:
+      module: bigip_virtual_server
+      server: 192.168.0.1
+      user: admin
+      password: mysecret
+      names:
+        - /Common/www_vs
+        - /Apps/api_vs
+      state: disabled
 '''
 
 try:
@@ -76,9 +117,7 @@ except ImportError:
 else:
     bigsuds_found = True
 
-def bigip_api(server, user, password):
-    api = bigsuds.BIGIP(hostname=server, username=user, password=password)
-    return api
+from ansible.module_utils.bigip_common import bigip_api, wait_for_status, wait_failure_message
 
 def virtual_server_exists(api, name):
     # hack to determine if virtual server exists
@@ -110,14 +149,71 @@ def set_virtual_server_state(api, name, state):
 def set_system_active_folder(api, folder):
     api.System.Session.set_active_folder(folder)
 
+def group_by_partition(names):
+    # list of (partition, full paths), partitions in the order first seen
+    partitions = []
+    grouped = {}
+    for name in names:
+        if not name.startswith('/') or name.count('/') < 2:
+            raise ValueError("virtual server %s is not a full path like /Common/name" % name)
+        partition = name.split('/')[1]
+        if partition not in grouped:
+            partitions.append(partition)
+            grouped[partition] = []
+        if name not in grouped[partition]:
+            grouped[partition].append(name)
+    return [(partition, grouped[partition]) for partition in partitions]
+
+def set_virtual_server_states(api, names, state, check_mode):
+    # reads every partition before writing any, so a missing virtual server
+    # fails the task without leaving the others half changed. Per partition
+    # one list and one read, then one folder switch at most and one write
+    results = []
+    planned = []
+    missing = []
+    current_folder = get_system_active_folder(api)
+    for partition, members in group_by_partition(names):
+        folder = '/%s' % partition
+        if folder != current_folder:
+            set_system_active_folder(api, folder)
+            current_folder = folder
+        # get_list only covers the partition's own folder, virtual servers in
+        # subfolders such as iApp .app folders are probed one by one
+        existing = set(api.LocalLB.VirtualServer.get_list())
+        absent = [name for name in members if name not in existing and not virtual_server_exists(api, name)]
+        if absent:
+            missing.extend(absent)
+            continue
+        current = api.LocalLB.VirtualServer.get_enabled_state(members)
+        before = [s.split('STATE_')[1].lower() for s in current]
+        planned.append((folder, [name for name, b in zip(members, before) if b != state]))
+        results.extend({'name': name, 'before': b, 'after': state, 'changed': b != state}
+                       for name, b in zip(members, before))
+    if missing:
+        raise ValueError("virtual servers do not exist: %s" % ", ".join(missing))
+    if not check_mode:
+        # the folder of the last read is still active, start the writes there
+        for folder, changes in reversed(planned):
+            if not changes:
+                continue
+            if folder != current_folder:
+                set_system_active_folder(api, folder)
+                current_folder = folder
+            api.LocalLB.VirtualServer.set_enabled_state(changes, ["STATE_%s" % state.upper()] * len(changes))
+    return {'changed': any(r['changed'] for r in results), 'virtual_servers': results}
+
 def main():
     module = AnsibleModule(
         argument_spec = dict(
             server = dict(type='str', required=True),
             user = dict(type='str', required=True),
             password = dict(type='str', required=True, no_log=True),
-            name = dict(type='str', required=True),
-            state = dict(type='str', required=True, choices=['enabled', 'disabled'])
+            name = dict(type='str', required=False),
+            names = dict(type='list', required=False),
+            state = dict(type='str', required=True, choices=['enabled', 'disabled']),
+            wait_timeout = dict(type='int', default=0),
+            wait_availability = dict(type='str', choices=['green', 'yellow', 'red', 'blue', 'gray']),
+            broker_socket = dict(type='str', default='~/.ansible/bigip_broker.sock')
         ),
         supports_check_mode=True
     )
@@ -129,30 +225,31 @@ def main():
     user = module.params['user']
     password = module.params['password']
     name = module.params['name']
+    names = module.params['names']
     state = module.params['state']
-    
-    partition = name.split('/')[1]
-    full_path_partition = '/{0}'.format(partition)
+
+    if (name is None) == (names is None):
+        module.fail_json(msg="exactly one of name and names is required")
 
     result = {'changed': False}  # default
 
     try:
-        api = bigip_api(server, user, password)
-        
-        current_folder = get_system_active_folder(api)
-        if partition != current_folder:
-            set_system_active_folder(api, full_path_partition)
+        api = bigip_api(server, user, password, module.params['broker_socket'])
+
+        if names is not None:
+            try:
+                result = set_virtual_server_states(api, names, state, module.check_mode)
+            except ValueError, e:
+                module.fail_json(msg=str(e))
+            targets = [(r['name'], r['name'], state) for r in result['virtual_servers']]
+        else:
+            partition = name.split('/')[1]
+            full_path_partition = '/{0}'.format(partition)
+
+            current_folder = get_system_active_folder(api)
+            if partition != current_folder:
+                set_system_active_folder(api, full_path_partition)
 
-        if state == 'enabled':
-            if not virtual_server_exists(api, name):
-                module.fail_json(msg="virtual server does not exist")
-            if state != get_virtual_server_state(api, name):
-                if not module.check_mode:
-                    set_virtual_server_state(api, name, state)
-                    result = {'changed': True}
-                else:
-                    result = {'changed': True}
-        elif state == 'disabled':
             if not virtual_server_exists(api, name):
                 module.fail_json(msg="virtual server does not exist")
             if state != get_virtual_server_state(api, name):
@@ -161,10 +258,19 @@ def main():
                     result = {'changed': True}
                 else:
                     result = {'changed': True}
+            targets = [(name, name, state)]
+
+        if targets and module.params['wait_timeout'] > 0 and not module.check_mode:
+            result['wait'] = wait_for_status(api.LocalLB.VirtualServer.get_object_status, targets,
+                                             module.params['wait_availability'],
+                                             module.params['wait_timeout'])
 
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
 
+    if 'wait' in result and not result['wait']['converged']:
+        module.fail_json(msg=wait_failure_message(result['wait'], module.params['wait_timeout']), **result)
+
     module.exit_json(**result)
 
 # import module snippets
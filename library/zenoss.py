@@ -42,12 +42,50 @@ options:
             - zenoss method to evoke
         required: true
         default: null
-        choices: ['get_devices', 'set_production_state']
+        choices: ['get_devices', 'set_production_state', 'add_device', 'remove_device']
         aliases: []
     device_name:
         description:
             - zenoss device_name
-        required: true
+        required: false
+        default: null
+        choices: []
+        aliases: []
+    device_names:
+        description:
+            - List of device names for set_production_state or
+              set_component_monitor. All of them are resolved with name filtered
+              lookups sent as one request. For set_production_state devices
+              already in state are skipped and the rest are changed chunk_size
+              devices per request. For set_component_monitor the first page of
+              components of all devices is read with one request, devices whose
+              first page has no exact match but more components are paged
+              through, and all matches are changed with one call.
+              Returns per device results in devices
+        required: false
+        default: null
+        choices: []
+        aliases: []
+    chunk_size:
+        description:
+            - Devices per setProductionState request with device_names
+        required: false
+        default: 100
+        choices: []
+        aliases: []
+    component_name:
+        description:
+            - Component name for get_component and set_component_monitor. Components
+              are filtered by name on the server and paged through until the
+              first exact match
+        required: false
+        default: null
+        choices: []
+        aliases: []
+    meta_type:
+        description:
+            - Component meta type to filter on the server, for example IpInterface
+        required: false
         default: null
         choices: []
         aliases: []
@@ -58,6 +96,64 @@ options:
         default: null
         choices: []
         aliases: []
+    device_class:
+        description:
+            - Device class of devices created by add_device
+        required: false
+        default: null
+        choices: []
+        aliases: []
+    collector:
+        description:
+            - Collector of devices created by add_device
+        required: false
+        default: localhost
+        choices: []
+        aliases: []
+    concurrency:
+        description:
+            - Number of requests in flight at once for device_names operations,
+              add_device and remove_device. The HTTP keep-alive pool is sized to match
+        required: false
+        default: 1
+        choices: []
+        aliases: []
+    timeout:
+        description:
+            - Seconds to wait for each Zenoss response
+        required: false
+        default: 30
+        choices: []
+        aliases: []
+    retries:
+        description:
+            - Times a request is retried, with exponential backoff, after a 5xx
+              response or a connection error. Requests that change devices
+              (addDevice, removeDevices, setProductionState and
+              setComponentsMonitored) are only retried when the connection could
+              not be established, never after the server may have applied them
+        required: false
+        default: 2
+        choices: []
+        aliases: []
+    index_ttl:
+        description:
+            - Seconds a device name to uid mapping is kept in a local index under
+              cache_dir. Device lookups are answered from the index while fresh,
+              otherwise filtered by name on the server and added to the index.
+              Entries are dropped when their device is removed or a call reports
+              their uid as not found. 0 disables the index
+        required: false
+        default: 0
+        choices: []
+        aliases: []
+    cache_dir:
+        description:
+            - Directory of the local device index
+        required: false
+        default: ~/.ansible/zenoss
+        choices: []
+        aliases: []
 
 '''
 
@@ -70,13 +166,38 @@ EXAMPLES = '''
       method=set_production_state
       path='Server/SSH/Linux/asrv/devices/mll-asrv01a.surescripts-lt.ext'
       state=300
+
+  - name: Set maintenance mode on all web servers
+    zenoss:
+      server: https://zenoss.surescripts.internal
+      username: admin
+      password: mysecret
+      method: set_production_state
+      device_names: "{{ groups['web'] }}"
+      state: 300
+
+  - name: Remove decommissioned hosts
+    zenoss:
+      server: https://zenoss.surescripts.internal
+      username: admin
+      password: mysecret
+      method: remove_device
+      device_names: "{{ decommissioned }}"
+      concurrency: 4
 '''
 '''Python module to work with the Zenoss JSON API
 Liberally borrowed from https://github.com/iamseth/python-zenoss
 '''
+import os
+import random
 import re
 import json
+import tempfile
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
 
 requests.packages.urllib3.disable_warnings()
 
@@ -92,6 +213,21 @@ ROUTERS = {'MessagingRouter': 'messaging',
            'MibRouter': 'mib',
            'ZenPackRouter': 'zenpack'}
 
+# how router responses report a uid that no longer exists
+NOT_FOUND = re.compile(r'not\s*found', re.I)
+
+# router methods that must not be replayed once the server may have seen them
+NON_IDEMPOTENT = set(['addDevice', 'removeDevices', 'setProductionState', 'setComponentsMonitored'])
+
+
+def connect_failed(error):
+    '''True when a request failed before reaching the server, so it can be sent again
+    '''
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
 
 class ZenossException(Exception):
     '''Custom exception for Zenoss
@@ -99,33 +235,98 @@ class ZenossException(Exception):
     pass
 
 
+class DeviceIndex(object):
+    '''Device name to uid and hash mapping persisted between runs, each entry expiring after ttl seconds
+    '''
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        try:
+            with open(path) as index_file:
+                self.devices = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            self.devices = {}
+
+    def get(self, device_name):
+        entry = self.devices.get(device_name)
+        if entry is None or time.time() - entry['time'] > self.ttl:
+            return None
+        return {'name': device_name, 'uid': entry['uid'], 'hash': entry['hash'], 'cached': True}
+
+    def update(self, devices, device_hash):
+        now = time.time()
+        with self.lock:
+            for device in devices:
+                self.devices[device['name']] = {'uid': device['uid'], 'hash': device_hash, 'time': now}
+            self.save()
+
+    def evict(self, device_name):
+        with self.lock:
+            if self.devices.pop(device_name, None) is not None:
+                self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as index_file:
+                json.dump(self.devices, index_file)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+
 class Zenoss(object):
     '''A class that represents a connection to a Zenoss server
     '''
-    def __init__(self, host, username, password, ssl_verify=True):
+    def __init__(self, host, username, password, ssl_verify=True, index_path=None, index_ttl=0,
+                 concurrency=1, timeout=30, retries=2):
         self.__host = host
         self.__session = requests.Session()
         self.__session.auth = (username, password)
         self.__session.verify = ssl_verify
+        # one keep-alive connection per worker plus one for component prefetching
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency + 1)
+        self.__session.mount('https://', adapter)
+        self.__session.mount('http://', adapter)
+        self.__concurrency = concurrency
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__lock = threading.Lock()
         self.__req_count = 0
+        self.__queue = []
+        self.__index = None
+        if index_path and index_ttl > 0:
+            self.__index = DeviceIndex(index_path, index_ttl)
 
-    def __router_request(self, router, method, data=None):
-        '''Internal method to make calls to the Zenoss request router
+    def __post(self, router, rpcs):
+        '''Internal method to send a list of rpcs to one router, returns the responses as a list
         '''
         if router not in ROUTERS:
             raise Exception('Router "' + router + '" not available.')
 
-        req_data = json.dumps([dict(
-            action=router,
-            method=method,
-            data=data,
-            type='rpc',
-            tid=self.__req_count)])
-
         uri = '%s/zport/dmd/%s_router' % (self.__host, ROUTERS[router])
         headers = {'Content-type': 'application/json; charset=utf-8'}
-        response = self.__session.post(uri, data=req_data, headers=headers)
-        self.__req_count += 1
+        # changes are only retried when they never reached the server
+        idempotent = not any(rpc['method'] in NON_IDEMPOTENT for rpc in rpcs)
+        delay = 0.5
+        for attempt in range(self.__retries + 1):
+            try:
+                response = self.__session.post(uri, data=json.dumps(rpcs), headers=headers,
+                                               timeout=self.__timeout)
+            except requests.exceptions.ConnectionError as e:
+                if attempt == self.__retries or not (idempotent or connect_failed(e)):
+                    raise
+            else:
+                if response.status_code < 500:
+                    break
+                if attempt == self.__retries or not idempotent:
+                    raise ZenossException('Request failed. HTTP {0}.'.format(response.status_code))
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
+            delay *= 2
 
         # The API returns a 200 response code even whe auth is bad.
         # With bad auth, the login page is displayed. Here I search for
@@ -134,14 +335,102 @@ class Zenoss(object):
         if re.search('name="__ac_name"', response.content.decode("utf-8")):
             raise ZenossException('Request failed. Bad username/password.')
 
-        return json.loads(response.content.decode("utf-8"))['result']
+        # Ext.Direct answers a single rpc with an object and several with a list
+        responses = json.loads(response.content.decode("utf-8"))
+        if isinstance(responses, dict):
+            responses = [responses]
+        for rpc_response in responses:
+            if rpc_response.get('type') == 'exception':
+                raise ZenossException('{0} failed: {1}'.format(rpc_response.get('method'),
+                                                              rpc_response.get('message')))
+        return responses
+
+    def __rpc(self, router, method, data):
+        with self.__lock:
+            rpc = dict(action=router, method=method, data=data, type='rpc', tid=self.__req_count)
+            self.__req_count += 1
+        return rpc
+
+    def __router_request(self, router, method, data=None):
+        '''Internal method to make calls to the Zenoss request router
+        '''
+        return self.__post(router, [self.__rpc(router, method, data)])[0]['result']
+
+    def queue(self, router, method, data=None):
+        '''Queue a router call for the next flush, returns its position in the flushed results.
+
+        '''
+        self.__queue.append((router, method, data))
+        return len(self.__queue) - 1
+
+    def flush(self):
+        '''Send the queued router calls as one request per router, results in queue order.
+
+        '''
+        queued, self.__queue = self.__queue, []
+        return self.batch(queued)
+
+    def batch(self, calls):
+        '''Send (router, method, data) calls as one request per router, results in call order.
+
+        '''
+        results = [None] * len(calls)
+        by_router = {}
+        for position, (router, method, data) in enumerate(calls):
+            by_router.setdefault(router, []).append((position, method, data))
+        for router, router_calls in by_router.items():
+            rpcs = []
+            positions = {}
+            for position, method, data in router_calls:
+                rpc = self.__rpc(router, method, data)
+                positions[rpc['tid']] = position
+                rpcs.append(rpc)
+            for rpc_response in self.__post(router, rpcs):
+                results[positions[rpc_response['tid']]] = rpc_response['result']
+        return results
+
+    def map(self, function, items):
+        '''Call function on every item, on up to concurrency threads, results in item order.
 
-    def get_devices(self, device_class='/zport/dmd/Devices', limit=None, **kwargs):
+        '''
+        if self.__concurrency <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        results = [None] * len(items)
+        errors = []
+        pending = list(enumerate(items))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    if not pending or errors:
+                        return
+                    index, item = pending.pop(0)
+                try:
+                    results[index] = function(item)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(min(self.__concurrency, len(items)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def get_devices(self, device_class='/zport/dmd/Devices', limit=None, start=0, keys=None, **kwargs):
         '''Get a list of all devices.
 
         '''
-        return self.__router_request('DeviceRouter', 'getDevices',
-                                     data=[{'uid': device_class, 'params': kwargs, 'limit': limit}])
+        data = {'uid': device_class, 'params': kwargs, 'limit': limit}
+        if start:
+            data['start'] = start
+        if keys:
+            data['keys'] = keys
+        return self.__router_request('DeviceRouter', 'getDevices', data=[data])
 
     def get_components(self, device_name, **kwargs):
         '''Get components for a device given the name
@@ -158,6 +447,69 @@ class Zenoss(object):
                     limit=limit, page=page, sort=sort, dir=dir, name=name)
         return self.__router_request('DeviceRouter', 'getComponents', [data])
 
+    def iter_components(self, uid, meta_type=None, name=None, page_size=50):
+        '''Yield the components of a device, fetching the next page while the current one is consumed.
+
+        No other calls may be made on this connection until the iteration ends or is closed.
+        '''
+        def fetch(start, out):
+            try:
+                out.append(self.get_components_by_uid(uid=uid, meta_type=meta_type, start=start,
+                                                      limit=page_size, page=start // page_size, name=name))
+            except Exception as e:
+                out.append(e)
+
+        start = 0
+        page = []
+        fetch(start, page)
+        while True:
+            if isinstance(page[0], Exception):
+                raise page[0]
+            components = page[0]['data']
+            start += page_size
+            next_page = []
+            prefetch = None
+            if components and start < page[0]['totalCount']:
+                prefetch = threading.Thread(target=fetch, args=(start, next_page))
+                prefetch.start()
+            try:
+                for component in components:
+                    yield component
+            finally:
+                # also runs when the caller stops early
+                if prefetch is not None:
+                    prefetch.join()
+            if prefetch is None:
+                return
+            page = next_page
+
+    def find_component(self, uid, component_name, meta_type=None):
+        '''Find a component of a device by name, reading pages only until it is found.
+
+        '''
+        components = self.iter_components(uid, meta_type=meta_type, name=component_name)
+        try:
+            for component in components:
+                if component['name'] == component_name:
+                    return component
+        finally:
+            components.close()
+        return None
+
+    def get_components_by_uids(self, uids, meta_type=None, name=None, limit=50, batch_size=100):
+        '''Get components for many devices, one getComponents per device, batch_size per request
+        '''
+        calls = [('DeviceRouter', 'getComponents',
+                  [dict(uid=uid, meta_type=meta_type, keys=None, start=0,
+                        limit=limit, page=0, sort='name', dir='ASC', name=name)]) for uid in uids]
+        return self.__batches(calls, batch_size)
+
+    def set_many_components_monitored(self, components, monitor):
+        '''Set monitor state for many components with one call
+        '''
+        data = dict(uids=[c['uid'] for c in components], monitor=monitor, hashcheck=1)
+        return self.__router_request('DeviceRouter', 'setComponentsMonitored', [data])
+
     def set_components_monitored(self, component, monitor):
         '''Set monitor state for component
         '''
@@ -169,15 +521,40 @@ class Zenoss(object):
         '''Find a device by name.
 
         '''
-        all_devices = self.get_devices()
-
-        try:
-            device = [d for d in all_devices['devices'] if d['name'] == device_name][0]
+        if self.__index is not None:
+            device = self.__index.get(device_name)
+            if device is not None:
+                return device
+
+        # the name param is a substring match on the server
+        devices = self.get_devices(name=device_name)
+        matches = [d for d in devices['devices'] if d['name'] == device_name]
+        if matches:
+            device = matches[0]
             # We need to save the has for later operations
-            device['hash'] = all_devices['hash']
+            device['hash'] = devices['hash']
+            if self.__index is not None:
+                self.__index.update([device], devices['hash'])
             return device
-        except IndexError:
-            raise Exception('Cannot locate device %s' % device_name)
+        raise Exception('Cannot locate device %s' % device_name)
+
+    def __device_request(self, device_name, request):
+        '''Internal method to call request(device), dropping a stale index entry and looking the device up again
+        '''
+        device = self.find_device(device_name)
+        try:
+            response = request(device)
+        except ZenossException as e:
+            if not NOT_FOUND.search(str(e)):
+                raise
+            response = {'success': False, 'msg': str(e)}
+        if response.get('success', True) or not NOT_FOUND.search(response.get('msg') or ''):
+            return response
+        if self.__index is not None:
+            self.__index.evict(device_name)
+        if not device.get('cached'):
+            return response
+        return request(self.find_device(device_name))
 
     def device_uid(self, device):
         '''Helper method to retrieve the device UID for a given device name
@@ -195,17 +572,59 @@ class Zenoss(object):
         '''Remove a device.
 
         '''
-        device = self.find_device(device_name)
-        data = dict(uids=[device['uid']], hashcheck=device['hash'], action='delete')
-        return self.__router_request('DeviceRouter', 'removeDevices', [data])
+        def remove(device):
+            data = dict(uids=[device['uid']], hashcheck=device['hash'], action='delete')
+            return self.__router_request('DeviceRouter', 'removeDevices', [data])
+
+        response = self.__device_request(device_name, remove)
+        if response.get('success', True) and self.__index is not None:
+            self.__index.evict(device_name)
+        return response
 
     def set_prod_state(self, device_name, prod_state):
         '''Set the production state of a device.
 
         '''
-        device = self.find_device(device_name)
-        data = dict(uids=[device['uid']], prodState=prod_state, hashcheck=device['hash'])
-        return self.__router_request('DeviceRouter', 'setProductionState', [data])
+        def set_state(device):
+            data = dict(uids=[device['uid']], prodState=prod_state, hashcheck=device['hash'])
+            return self.__router_request('DeviceRouter', 'setProductionState', [data])
+
+        return self.__device_request(device_name, set_state)
+
+    def resolve_devices(self, device_names, batch_size=100):
+        '''Find many devices by name, one name filtered getDevices per device, batch_size per request.
+
+        The inventory is never listed unfiltered, and the devices found are added to the local index.
+        '''
+        device_names = sorted(set(device_names))
+        calls = [('DeviceRouter', 'getDevices',
+                  [{'uid': '/zport/dmd/Devices', 'params': {'name': device_name}, 'limit': None,
+                    'keys': ['name', 'uid', 'productionState']}]) for device_name in device_names]
+        found = {}
+        device_hash = None
+        for device_name, devices in zip(device_names, self.__batches(calls, batch_size)):
+            device_hash = devices.get('hash', device_hash)
+            for device in devices['devices']:
+                if device['name'] == device_name:
+                    found[device_name] = device
+        if found and self.__index is not None:
+            self.__index.update(found.values(), device_hash)
+        return found, device_hash
+
+    def set_prod_states(self, uids, prod_state, device_hash, chunk_size=100):
+        '''Set the production state of many devices, chunk_size per request.
+
+        '''
+        def set_chunk(chunk):
+            data = dict(uids=chunk, prodState=prod_state, hashcheck=device_hash)
+            return self.__router_request('DeviceRouter', 'setProductionState', [data])
+
+        return self.map(set_chunk, [uids[start:start + chunk_size] for start in range(0, len(uids), chunk_size)])
+
+    def __batches(self, calls, batch_size):
+        # batch_size calls per request, requests spread over the workers
+        chunks = [calls[start:start + batch_size] for start in range(0, len(calls), batch_size)]
+        return [result for results in self.map(self.batch, chunks) for result in results]
 
     def set_maintenance(self, device_name):
         '''Helper method to set prodState for device so that it does not alert.
@@ -226,10 +645,20 @@ def main():
                     username = dict(type='str', required=True),
                     password = dict(type='str', required=True, no_log=True),
                     method = dict(type='str', required=True),
-                    device_name = dict(type='str', required=True),
+                    device_name = dict(type='str', required=False),
+                    device_names = dict(type='list', required=False),
+                    chunk_size = dict(type='int', default=100),
                     component_name=dict(type='str', required=False),
+                    meta_type=dict(type='str', required=False),
                     state = dict(type='int', required=False),
                     monitor=dict(type='bool', required=False),
+                    device_class=dict(type='str', required=False),
+                    collector=dict(type='str', default='localhost'),
+                    concurrency=dict(type='int', default=1),
+                    timeout=dict(type='int', default=30),
+                    retries=dict(type='int', default=2),
+                    index_ttl=dict(type='int', default=0),
+                    cache_dir=dict(type='str', default='~/.ansible/zenoss'),
             ),
             supports_check_mode=False
     )
@@ -239,17 +668,110 @@ def main():
     password = module.params['password']
     method = module.params['method']
     device_name = module.params['device_name']
+    device_names = module.params['device_names']
     component_name = module.params['component_name']
     state = module.params['state']
     monitor = module.params['monitor']
 
+    if (device_name is None) == (device_names is None):
+        module.fail_json(msg="exactly one of device_name and device_names is required")
+    multi_device_methods = ['set_production_state', 'set_component_monitor', 'add_device', 'remove_device']
+    if device_names is not None and method not in multi_device_methods:
+        module.fail_json(msg="device_names is only supported by {0}".format(', '.join(multi_device_methods)))
+    if module.params['chunk_size'] < 1:
+        module.fail_json(msg="chunk_size must be at least 1")
+    if module.params['concurrency'] < 1 or module.params['timeout'] < 1 or module.params['retries'] < 0:
+        module.fail_json(msg="concurrency and timeout must be at least 1 and retries at least 0")
+
     hashcheck = 1
     result = {'changed': False}  # default
 
     # initiate zenoss connection
-    z = Zenoss(server, username, password, False)
+    index_path = os.path.join(os.path.expanduser(module.params['cache_dir']),
+                              '{0}-devices.json'.format(re.sub(r'[^A-Za-z0-9_.-]', '_', server)))
+    z = Zenoss(server, username, password, False, index_path, module.params['index_ttl'],
+               module.params['concurrency'], module.params['timeout'], module.params['retries'])
 
-    if method == 'get_devices':
+    if method == 'set_production_state' and device_names is not None:
+        if state is None:
+            module.fail_json(msg="State parameter is required")
+        found, device_hash = z.resolve_devices(device_names)
+        missing = sorted(set(name for name in device_names if name not in found))
+        if missing:
+            module.fail_json(msg="Cannot locate devices: {0}".format(', '.join(missing)))
+        result['devices'] = []
+        uids = []
+        for name in sorted(set(device_names)):
+            device = found[name]
+            changed = device['productionState'] != state
+            if changed:
+                uids.append(device['uid'])
+            result['devices'].append({'name': name, 'uid': device['uid'], 'before': device['productionState'],
+                                      'after': state, 'changed': changed})
+        if uids:
+            responses = z.set_prod_states(uids, state, device_hash, module.params['chunk_size'])
+            result['changed'] = True
+            failed = [r.get('msg', '') for r in responses if not r.get('success', True)]
+            if failed:
+                module.fail_json(msg="setProductionState failed: {0}".format('; '.join(failed)), **result)
+        result['msg'] = "{0} of {1} devices set to production state {2}".format(len(uids), len(result['devices']), state)
+    elif method == 'set_component_monitor' and device_names is not None:
+        if component_name is None or monitor is None:
+            module.fail_json(msg="Component name and monitor parameters are required")
+        found, device_hash = z.resolve_devices(device_names)
+        missing = sorted(set(name for name in device_names if name not in found))
+        if missing:
+            module.fail_json(msg="Cannot locate devices: {0}".format(', '.join(missing)))
+        names = sorted(found)
+        all_components = z.get_components_by_uids([found[name]['uid'] for name in names],
+                                                   meta_type=module.params['meta_type'], name=component_name)
+        matched = {}
+        truncated = []
+        for name, components in zip(names, all_components):
+            matches = [c for c in components['data'] if c['name'] == component_name]
+            if matches:
+                matched[name] = matches[0]
+            elif len(components['data']) < components['totalCount']:
+                truncated.append(name)
+        # the first page can hold only substring matches, page through the rest of those devices.
+        # One device at a time, as iter_components already keeps a prefetch connection busy
+        for name in truncated:
+            component = z.find_component(found[name]['uid'], component_name, module.params['meta_type'])
+            if component is not None:
+                matched[name] = component
+        result['devices'] = []
+        to_change = []
+        for name in names:
+            if name not in matched:
+                module.fail_json(msg="Component: {0} is not in provided device: {1}".format(component_name, name))
+            changed = matched[name]['monitored'] != monitor
+            if changed:
+                to_change.append(matched[name])
+            result['devices'].append({'name': name, 'component': matched[name]['uid'], 'changed': changed})
+        if to_change:
+            response = z.set_many_components_monitored(to_change, monitor)
+            result['msg'] = response['msg']
+            result['changed'] = True
+    elif method in ['add_device', 'remove_device']:
+        if method == 'add_device' and module.params['device_class'] is None:
+            module.fail_json(msg="device_class parameter is required")
+
+        def run(name):
+            try:
+                if method == 'add_device':
+                    response = z.add_device(name, module.params['device_class'], module.params['collector'])
+                else:
+                    response = z.remove_device(name)
+            except Exception as e:
+                return {'name': name, 'failed': True, 'msg': str(e)}
+            return {'name': name, 'failed': not response.get('success', True), 'msg': response.get('msg', '')}
+
+        result['devices'] = z.map(run, device_names if device_names is not None else [device_name])
+        result['changed'] = any(not d['failed'] for d in result['devices'])
+        failed = [d['name'] for d in result['devices'] if d['failed']]
+        if failed:
+            module.fail_json(msg="{0} failed for: {1}".format(method, ', '.join(failed)), **result)
+    elif method == 'get_devices':
         devices = z.get_devices(name=device_name)
         result['devices'] = devices['devices']
     elif method == 'get_production_state':
@@ -274,11 +796,7 @@ def main():
     elif method == 'get_component':
         if component_name is None:
             module.fail_json(msg="Component name parameter is required")
-        component = {}
-        components = z.get_components(device_name=device_name)
-        for temp_component in components['data']:
-            if temp_component['name'] == component_name:
-                component = temp_component
+        component = z.find_component(z.device_uid(device_name), component_name, module.params['meta_type'])
         if component:
             result['component'] = component
             result['changed'] = True
@@ -287,13 +805,7 @@ def main():
     elif method == 'set_component_monitor':
         if component_name is None or monitor is None:
             module.fail_json(msg="Component name and monitor parameters are required")
-        component = {}
-        # could check to make sure the device exists first?
-        components = z.get_components(device_name=device_name)
-        for temp_component in components['data']:
-            if temp_component['name'] == component_name:
-                component = temp_component
-                break
+        component = z.find_component(z.device_uid(device_name), component_name, module.params['meta_type'])
         if component:
             if component['monitored'] != monitor:
                 response = z.set_components_monitored(component=component, monitor=monitor)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Helpers shared by the bigip_* modules in library/
+
+Ansible picks this directory up next to the playbooks and ships the helpers
+with every module that imports them from ansible.module_utils.bigip_common.
+'''
+
+try:
+    import bigsuds
+except ImportError:
+    # the modules check for bigsuds and fail with their own message
+    bigsuds = None
+
+import glob
+import json
+import os
+import random
+import re
+import socket
+import tempfile
+import time
+
+
+class BrokerApi(object):
+    '''Stand-in for bigsuds.BIGIP that forwards calls to a bigip_broker process'''
+    def __init__(self, conn, credentials, path=''):
+        self._conn = conn
+        self._credentials = credentials
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return BrokerApi(self._conn, self._credentials, (self._path + '.' + name).lstrip('.'))
+
+    def __call__(self, *args, **kwargs):
+        sock, rfile = self._conn
+        request = dict(self._credentials, method=self._path, args=args, kwargs=kwargs)
+        sock.sendall(json.dumps(request) + '\n')
+        line = rfile.readline()
+        if not line:
+            raise Exception("bigip_broker closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            if response['type'] == 'OperationFailed':
+                raise bigsuds.OperationFailed(response['error'])
+            raise Exception(response['error'])
+        return response['result']
+
+    def _close(self):
+        sock, rfile = self._conn
+        rfile.close()
+        sock.close()
+
+
+def broker_api(broker_socket, server, user, password):
+    # None when no broker is listening, the caller then builds its own client
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(os.path.expanduser(broker_socket))
+    except socket.error:
+        sock.close()
+        return None
+    credentials = {'host': server, 'user': user, 'password': password}
+    return BrokerApi((sock, sock.makefile('r')), credentials)
+
+def bigip_api(server, user, password, broker_socket=None):
+    api = None
+    if broker_socket:
+        api = broker_api(broker_socket, server, user, password)
+    if api is None:
+        api = bigsuds.BIGIP(hostname=server, username=user, password=password)
+    return api
+
+
+def server_cache_dir(cache_dir, server):
+    # per server directory of the bigip_gtm_facts_v2 cache
+    return os.path.join(os.path.expanduser(cache_dir), re.sub(r'[^A-Za-z0-9_.-]', '_', server))
+
+def invalidate_fact_cache(cache_dir, server, categories):
+    # drop bigip_gtm_facts_v2 cache entries made stale by a change
+    server_dir = server_cache_dir(cache_dir, server)
+    for category in categories:
+        for path in glob.glob(os.path.join(server_dir, "%s-*.json" % category)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def qualify(name, partition='Common'):
+    if name.startswith('/'):
+        return name
+    return "/%s/%s" % (partition, name)
+
+# short pool types accepted by the modules, see query_type
+POOL_TYPES = ['a', 'aaaa', 'cname', 'mx', 'naptr', 'srv']
+
+def query_type(pool_type):
+    return "GTM_QUERY_TYPE_%s" % pool_type.strip().upper()
+
+
+class ObjectIndex(object):
+    '''Names of GTM objects from one get_list per category, optionally cached on the controller
+
+    categories maps a category to its GlobalLB interface and the existence key
+    of each listed item.
+    '''
+    def __init__(self, api, cache_dir, server, categories, ttl=0):
+        self.api = api
+        self.ttl = ttl
+        self.categories = categories
+        self.server_dir = server_cache_dir(cache_dir, server)
+        self.names = {}
+
+    def path(self, category):
+        # matches the "<category>-*.json" entries invalidated after a change
+        return os.path.join(self.server_dir, "%s-index.json" % category)
+
+    def load(self, category):
+        path = self.path(category)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as index_file:
+                return json.load(index_file)
+        except (OSError, IOError, ValueError):
+            return None
+
+    def save(self, category, names):
+        try:
+            if not os.path.isdir(self.server_dir):
+                os.makedirs(self.server_dir)
+        except OSError:
+            # another run may have created it in between
+            pass
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.server_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as index_file:
+                json.dump(names, index_file)
+            os.rename(tmp_path, self.path(category))
+        except (OSError, IOError):
+            pass
+
+    def get(self, category):
+        if category not in self.names:
+            names = None
+            if self.ttl > 0:
+                names = self.load(category)
+            if names is None:
+                interface, key = self.categories[category]
+                names = [key(item) for item in getattr(self.api.GlobalLB, interface).get_list()]
+                if self.ttl > 0:
+                    self.save(category, names)
+            # json turns tuple keys into lists
+            self.names[category] = set(tuple(n) if isinstance(n, list) else n for n in names)
+        return self.names[category]
+
+    def exists(self, category, key):
+        return key in self.get(category)
+
+
+def wait_for_status(get_object_status, targets, availability, timeout):
+    # one batched status call per poll, backing off exponentially with jitter,
+    # until every (id, name, enabled status) target matches or the deadline passes.
+    # disabled_by_parent counts as disabled, but a target waiting to be enabled
+    # under a disabled parent cannot get there, so such targets are reported as
+    # blocked and the wait ends once nothing else is pending
+    start = time.time()
+    deadline = start + timeout
+    delay = 0.5
+    polls = 0
+    while True:
+        statuses = get_object_status([t[0] for t in targets])
+        polls += 1
+        pending = []
+        blocked = []
+        for (_, name, enabled), status in zip(targets, statuses):
+            current_enabled = status['enabled_status'].replace('ENABLED_STATUS_', '').lower()
+            current_availability = status['availability_status'].replace('AVAILABILITY_STATUS_', '').lower()
+            current = {'name': name, 'enabled_status': current_enabled,
+                       'availability_status': current_availability}
+            if current_enabled == 'disabled_by_parent':
+                if enabled == 'enabled':
+                    blocked.append(current)
+                    continue
+                current_enabled = 'disabled'
+            if current_enabled != enabled or (availability and current_availability != availability):
+                pending.append(current)
+        now = time.time()
+        if not pending or now >= deadline:
+            return {'converged': not pending and not blocked, 'polls': polls,
+                    'elapsed': round(now - start, 3), 'pending': pending, 'blocked': blocked}
+        time.sleep(min(delay / 2 + random.uniform(0, delay / 2), deadline - now))
+        delay = min(delay * 2, 10)
+
+def wait_failure_message(wait, timeout):
+    messages = []
+    if wait['pending']:
+        messages.append("status did not converge within %d seconds" % timeout)
+    if wait['blocked']:
+        messages.append("disabled by parent, cannot become enabled: %s"
+                        % ", ".join(b['name'] for b in wait['blocked']))
+    return "; ".join(messages)